@@ -0,0 +1,83 @@
+"""Sidecar file for large packed array payloads, read without copying.
+
+Reading a packed array from BLOB_VALUE copies it into a Python bytes
+object first.  With an ArrayStore, payloads of at least min_bytes are
+appended instead to a data file next to the database (a.sqlite3 ->
+a.arrays), each starting on a page boundary.  The Entity row keeps the
+element count in INTEGER_VALUE and records the payload's byte offset in
+NUMERIC_VALUE, leaving BLOB_VALUE NULL; the element type is the TYPE_ID
+as before.  Readers map the file once and get memoryview or NumPy views
+straight into the page cache.
+
+The file is append-only.  Payloads of entities deleted by an incremental
+re-ingest stay behind until the next full rebuild truncates the file.
+"""
+import os
+import mmap
+
+PAGE_SIZE = mmap.PAGESIZE
+
+# Payloads smaller than this stay in BLOB_VALUE
+DEFAULT_MIN_BYTES = 64 * 1024
+
+def sidecar_path(db_path):
+    """The array file that goes with database db_path."""
+    return os.path.splitext(db_path)[0] + ".arrays"
+
+class ArrayStore:
+    """An append-only, page-aligned payload file and a read-only map of it.
+
+    mode is "r" to read, "a" to append to an existing store or "w" to
+    start an empty one, as for open().
+    """
+
+    def __init__(self, path, mode="r", min_bytes=DEFAULT_MIN_BYTES):
+        self.path = path
+        self.min_bytes = min_bytes
+        self.file = open(path, {"r": "rb", "a": "a+b", "w": "w+b"}[mode])
+        self.file.seek(0, os.SEEK_END)
+        self.size = self.file.tell()
+        self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def append(self, data):
+        """Write data at the next page boundary and return its offset."""
+        padding = -self.size % PAGE_SIZE
+        if padding:
+            self.file.write(bytes(padding))
+        offset = self.size + padding
+        self.file.write(data)
+        self.size = offset + len(data)
+        return offset
+
+    def flush(self):
+        self.file.flush()
+
+    def view(self, offset, byte_length):
+        """A memoryview of byte_length bytes at offset, backed by the map."""
+        if self.map is None or offset + byte_length > len(self.map):
+            # Grown since it was mapped.  Views of the old map keep it alive.
+            self.flush()
+            if self.size == 0:
+                raise ValueError(f"{self.path} is empty")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self.map)[offset:offset + byte_length]
+
+    def sync(self):
+        """Flush appended payloads to disk; call before committing the rows that refer to them."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        """Sync appended payloads, as sync() does, and close the file."""
+        if not self.file.closed:
+            if self.file.mode != "rb":
+                self.sync()
+            self.file.close()
+        self.map = None
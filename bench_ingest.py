@@ -0,0 +1,268 @@
+"""Ingest throughput benchmark over a synthetic X3D JSON corpus.
+
+generate_corpus() writes X3D-shaped documents: nested Transform/Group
+hierarchies whose leaves are Shapes with a Material and an
+IndexedFaceSet, and MetadataSet/Metadata* nodes along the way.  The same
+seed and parameters always produce byte-identical files.
+
+Each ingest script then runs in its own process against that corpus, in
+a scratch directory, and the results are printed as JSON:
+
+    python bench_ingest.py --files 20 --depth 4 --fanout 3 > results.json
+    python bench_ingest.py --baseline results.json --tolerance 0.1
+
+With --baseline the run fails (exit status 1) if any variant's rows/sec
+dropped by more than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs ingest.main with the visitor of one insert*.py script
+INGEST_RUNNER = '''
+import sys, importlib, ingest
+module = importlib.import_module(sys.argv[1])
+corpus_dir = sys.argv[2]
+sys.argv = [sys.argv[0]] + sys.argv[3:]
+ingest.main(module.EntityManager.visitor_class, [".json"], corpus_dir)
+'''
+
+# Variant name -> (database file, tables counted as ingested rows)
+VARIANTS = {
+    "insert": ("EntityRelationship.sqlite3", ("Entity", "Relationship")),
+    "insertjson": ("EntityRelationship.sqlite3", ("Entity", "Relationship")),
+    "insertjson2": ("EntityRelationship.sqlite3", ("Entity", "Relationship")),
+    "insertscalarrel": ("EntityRelationship.sqlite3", ("Entity", "Relationship")),
+    "connect": ("ThreeDimAssets.sqlite3", ("Objects",)),
+}
+
+METADATA_TYPES = ("MetadataInteger", "MetadataDouble", "MetadataFloat", "MetadataString", "MetadataBoolean")
+
+class SceneGenerator:
+    """Builds one X3D JSON document from a seeded random source.
+
+    depth and fanout shape the grouping hierarchy, array_length sizes the
+    coordinate, index and Metadata value arrays, and cardinality bounds
+    the number of distinct names and numbers, which sets how often the
+    ingest scripts find a value already interned.
+    """
+
+    def __init__(self, rng, depth=4, fanout=3, array_length=30, cardinality=1000):
+        self.rng = rng
+        self.depth = depth
+        self.fanout = fanout
+        self.array_length = array_length
+        self.cardinality = cardinality
+
+    def name(self, prefix):
+        return f"{prefix}{self.rng.randrange(self.cardinality)}"
+
+    def integer(self):
+        return self.rng.randrange(self.cardinality)
+
+    def real(self):
+        return self.rng.randrange(self.cardinality) / 8
+
+    def metadata(self, level=0):
+        """A MetadataSet of typed Metadata nodes, with a nested set above the leaves."""
+        values = []
+        for metadata_type in METADATA_TYPES:
+            if metadata_type == "MetadataInteger":
+                value = [self.integer() for _ in range(self.array_length)]
+            elif metadata_type == "MetadataString":
+                value = [self.name("label") for _ in range(max(1, self.array_length // 10))]
+            elif metadata_type == "MetadataBoolean":
+                value = self.rng.random() < 0.5
+            else:
+                value = [self.real() for _ in range(self.array_length)]
+            values.append({metadata_type: {"@name": self.name(metadata_type.lower()), "@value": value}})
+        if level == 0:
+            values.append(self.metadata(level + 1))
+        return {"MetadataSet": {"@name": self.name("set"), "-value": values}}
+
+    def shape(self):
+        points = [self.real() for _ in range(3 * self.array_length)]
+        coord_index = []
+        for _ in range(self.array_length // 4 or 1):
+            coord_index.extend(self.rng.randrange(self.array_length) for _ in range(3))
+            coord_index.append(-1)
+        return {"Shape": {
+            "-appearance": {"Appearance": {"-material": {"Material": {
+                "@DEF": self.name("material"),
+                "@diffuseColor": [round(self.rng.random(), 3) for _ in range(3)],
+                "@transparency": self.real() / self.cardinality,
+            }}}},
+            "-geometry": {"IndexedFaceSet": {
+                "@solid": False,
+                "@coordIndex": coord_index,
+                "-coord": {"Coordinate": {"@point": points}},
+            }},
+        }}
+
+    def node(self, level):
+        if level >= self.depth:
+            return self.shape()
+        group = "Transform" if self.rng.random() < 0.7 else "Group"
+        fields = {"@DEF": self.name(group.lower())}
+        if group == "Transform":
+            fields["@translation"] = [self.real() for _ in range(3)]
+            fields["@rotation"] = [0, 1, 0, self.real()]
+        fields["-metadata"] = self.metadata()
+        fields["-children"] = [self.node(level + 1) for _ in range(self.fanout)]
+        return {group: fields}
+
+    def document(self, title):
+        return {"X3D": {
+            "encoding": "UTF-8",
+            "@profile": "Immersive",
+            "@version": "3.3",
+            "head": {"meta": [
+                {"@name": "title", "@content": title},
+                {"@name": "creator", "@content": self.name("creator")},
+                {"@name": "generator", "@content": "bench_ingest.py"},
+            ]},
+            "Scene": {"-children": [
+                {"WorldInfo": {"@title": title}},
+                self.node(0),
+            ]},
+        }}
+
+def generate_corpus(out_dir, files=10, depth=4, fanout=3, array_length=30, cardinality=1000, seed=0):
+    """Write files documents under out_dir and return their total size in bytes."""
+    total_bytes = 0
+    for index in range(files):
+        # One seed per file, so the corpus does not depend on generation order
+        generator = SceneGenerator(random.Random(seed * 1000003 + index), depth, fanout, array_length, cardinality)
+        # Spread over subdirectories, as in the examples archive
+        file_dir = os.path.join(out_dir, f"set{index % 4}")
+        os.makedirs(file_dir, exist_ok=True)
+        file_path = os.path.join(file_dir, f"scene{index:04d}.json")
+        with open(file_path, 'w') as f:
+            json.dump(generator.document(f"scene{index:04d}"), f, indent=2)
+        total_bytes += os.path.getsize(file_path)
+    return total_bytes
+
+def variant_command(variant, corpus_dir, ingest_args):
+    if variant == "connect":
+        return [sys.executable, os.path.join(REPO_DIR, "connect.py"), corpus_dir]
+    return [sys.executable, "-c", INGEST_RUNNER, variant, corpus_dir] + list(ingest_args)
+
+def count_rows(db_path, tables):
+    connection = sqlite3.connect(db_path)
+    try:
+        return sum(connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables)
+    finally:
+        connection.close()
+
+def run_variant(variant, corpus_dir, files, ingest_args=()):
+    """Run one ingest script in a scratch directory and measure it."""
+    db_name, tables = VARIANTS[variant]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    with tempfile.TemporaryDirectory(prefix=f"bench_{variant}_") as work_dir:
+        start = time.perf_counter()
+        process = subprocess.Popen(variant_command(variant, corpus_dir, ingest_args), cwd=work_dir, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        else:
+            process.wait()
+            peak_rss = None
+        wall = time.perf_counter() - start
+
+        db_path = os.path.join(work_dir, db_name)
+        rows = count_rows(db_path, tables) if os.path.exists(db_path) else 0
+        return {
+            "variant": variant,
+            "returncode": process.returncode,
+            "wall_seconds": round(wall, 3),
+            "rows": rows,
+            "rows_per_second": round(rows / wall, 1),
+            "files_per_second": round(files / wall, 2),
+            "peak_rss_bytes": peak_rss,
+            "db_bytes": os.path.getsize(db_path) if os.path.exists(db_path) else 0,
+        }
+
+def regressions(results, baseline, tolerance):
+    """Variants whose rows/sec fell more than tolerance below the baseline's."""
+    previous = {result["variant"]: result for result in baseline["results"]}
+    slower = []
+    for result in results:
+        before = previous.get(result["variant"])
+        if before and result["rows_per_second"] < before["rows_per_second"] * (1 - tolerance):
+            slower.append((result["variant"], before["rows_per_second"], result["rows_per_second"]))
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingest scripts on a synthetic X3D JSON corpus")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=4, help="levels of Transform/Group above the Shapes")
+    parser.add_argument("--fanout", type=int, default=3, help="children per Transform/Group")
+    parser.add_argument("--array-length", type=int, default=30, help="points per Coordinate, values per Metadata array")
+    parser.add_argument("--cardinality", type=int, default=1000, help="distinct names and numbers to draw from")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--variants", nargs="+", choices=sorted(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--ingest-args", default="",
+                        help='extra arguments for the insert*.py variants, e.g. --ingest-args="--bulk --dedup"')
+    parser.add_argument("--corpus", help="generate the corpus here and keep it, instead of in a temporary directory")
+    parser.add_argument("--baseline", help="earlier output of this script to compare rows/sec against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed rows/sec drop against the baseline")
+    parser.add_argument("--output", help="write the JSON results here instead of to stdout")
+    args = parser.parse_args()
+
+    params = {name: getattr(args, name) for name in ("files", "depth", "fanout", "array_length", "cardinality", "seed")}
+    with tempfile.TemporaryDirectory(prefix="bench_corpus_") as temp_dir:
+        corpus_dir = os.path.abspath(args.corpus or temp_dir)
+        logger.info(f"Generating {args.files} files in {corpus_dir}")
+        corpus_bytes = generate_corpus(corpus_dir, **params)
+
+        results = []
+        for variant in args.variants:
+            logger.info(f"Running {variant}")
+            result = run_variant(variant, corpus_dir, args.files, args.ingest_args.split())
+            logger.info(f"{variant}: {result['rows_per_second']} rows/s, {result['wall_seconds']} s")
+            results.append(result)
+
+    report = {
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "corpus": dict(params, bytes=corpus_bytes),
+        "ingest_args": args.ingest_args,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    failed = [result["variant"] for result in results if result["returncode"] != 0]
+    for variant in failed:
+        logger.error(f"{variant} exited with an error")
+    slower = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for variant, before, after in slower:
+            logger.error(f"{variant} regressed: {before} -> {after} rows/s")
+    if failed or slower:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
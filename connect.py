@@ -1,193 +1,486 @@
 import sqlite3
 import os
 import json
+import argparse
+import re
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 
-connection = sqlite3.connect("ThreeDimAssets.sqlite3")
+from manifest import SourceManifest
+from idlease import IdAllocator
 
-connection.execute('DROP TABLE "Objects"')
+# Fields holding geometry and interpolator arrays: numbers or strings, never nodes
+DEFAULT_SKIP_FIELDS = ("@point", "@coordIndex", "@index", "@texCoordIndex", "@normalIndex", "@colorIndex",
+                       "@color", "@vector", "@key", "@keyValue")
 
-connection.execute('''CREATE TABLE "Objects" (
-	"ID"	INTEGER NOT NULL,
-	"PROPERTY_NAME"	TEXT NOT NULL,
-	"RELATED_ID"	INTEGER,
-	"INTEGER_VALUE"	INTEGER,
-	"TEXT_VALUE"	TEXT,
-	"BOOLEAN_VALUE"	TEXT,
-	"BLOB_VALUE"	BLOB,
-	"REAL_VALUE"	REAL,
-	"NUMERIC_VALUE"	NUMERIC
-)''')
+# Keys a file must contain, quoted, to have anything for Objects besides its filename
+QUICK_CHECK_KEYS = ('"meta"', '"Metadata', '"Material"')
 
-cursor = connection.cursor()
+# Objects column and converter for the values of each Metadata node type;
+# MetadataSet holds nodes instead, and Material is read for its diffuseColor
+METADATA_VALUES = {
+    "MetadataInteger": ("INTEGER_VALUE", None),
+    "MetadataDouble": ("REAL_VALUE", None),
+    "MetadataFloat": ("REAL_VALUE", None),
+    "MetadataString": ("TEXT_VALUE", None),
+    "MetadataBoolean": ("BOOLEAN_VALUE", lambda value: 'true' if value else 'false'),
+}
 
-def find_files(directory, extension):
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith(extension):
-                yield os.path.join(root, file)
+# Names of the diffuseColor components, by position
+COLOR_COMPONENTS = ('red', 'green', 'blue', 'alpha')
 
-class IdGen():
-    def __init__(self):
-        self.id = 0
+# Every row goes through one statement, so a file's rows are written in
+# order by one executemany.  A row binds its value once, with the number
+# of its column in VALUE_COLUMNS; the other columns stay NULL.
+VALUE_COLUMNS = ("RELATED_ID", "INTEGER_VALUE", "TEXT_VALUE", "BOOLEAN_VALUE", "REAL_VALUE")
+COLUMN_NUMBERS = {column: number for number, column in enumerate(VALUE_COLUMNS)}
+RELATED_ID = COLUMN_NUMBERS["RELATED_ID"]
+INSERT_OBJECT = (f"INSERT INTO ObjectData (ID, PROPERTY_NAME_ID, {', '.join(VALUE_COLUMNS)}) VALUES (?1, ?2, "
+                 + ", ".join(f"CASE ?3 WHEN {number} THEN ?4 END" for number in range(len(VALUE_COLUMNS))) + ")")
+
+# Layout of ThreeDimAssets.sqlite3, kept in PRAGMA user_version: 1 (or 0)
+# is a plain Objects table, 2 adds PropertyName, 3 adds FileMetadata, 4
+# keeps FileMetadata values as text with a separate NUMBER
+SCHEMA_VERSION = 4
+
+# A few hundred property names repeat on every row, so ObjectData stores
+# an integer key into PropertyName instead and the Objects view puts the
+# name back.  Each value column has an index by property for the query
+# GUI's filters; the text one is full, so it also finds all the rows of
+# a property, and the others only cover rows with a value in the column.
+OBJECTS_SQL = '''
+    CREATE TABLE IF NOT EXISTS "PropertyName" (
+        "ID" INTEGER PRIMARY KEY,
+        "NAME" TEXT NOT NULL UNIQUE
+    );
+
+    CREATE TABLE IF NOT EXISTS "ObjectData" (
+        "ID" INTEGER NOT NULL,
+        "PROPERTY_NAME_ID" INTEGER NOT NULL,
+        "RELATED_ID" INTEGER,
+        "INTEGER_VALUE" INTEGER,
+        "TEXT_VALUE" TEXT,
+        "BOOLEAN_VALUE" TEXT,
+        "BLOB_VALUE" BLOB,
+        "REAL_VALUE" REAL,
+        "NUMERIC_VALUE" NUMERIC,
+        FOREIGN KEY ("PROPERTY_NAME_ID") REFERENCES "PropertyName" ("ID")
+    );
+
+    -- A file's rows are the ID range handed out while reading it
+    CREATE INDEX IF NOT EXISTS idx_objectdata_id ON ObjectData(ID);
+    CREATE INDEX IF NOT EXISTS idx_objectdata_text ON ObjectData(PROPERTY_NAME_ID, TEXT_VALUE);
+    CREATE INDEX IF NOT EXISTS idx_objectdata_related ON ObjectData(PROPERTY_NAME_ID, RELATED_ID)
+        WHERE RELATED_ID IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_objectdata_integer ON ObjectData(PROPERTY_NAME_ID, INTEGER_VALUE)
+        WHERE INTEGER_VALUE IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_objectdata_boolean ON ObjectData(PROPERTY_NAME_ID, BOOLEAN_VALUE)
+        WHERE BOOLEAN_VALUE IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_objectdata_real ON ObjectData(PROPERTY_NAME_ID, REAL_VALUE)
+        WHERE REAL_VALUE IS NOT NULL;
+
+    -- Every meta and Metadata value of a file, keyed by name, for filtering files
+    CREATE TABLE IF NOT EXISTS "FileMetadata" (
+        "PROPERTY_NAME_ID" INTEGER NOT NULL,
+        "VALUE" TEXT NOT NULL,
+        "FILE_ID" INTEGER NOT NULL,
+        "NUMBER" NUMERIC,
+        PRIMARY KEY ("PROPERTY_NAME_ID", "VALUE", "FILE_ID"),
+        FOREIGN KEY ("PROPERTY_NAME_ID") REFERENCES "PropertyName" ("ID")
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_filemetadata_file ON FileMetadata(FILE_ID, PROPERTY_NAME_ID);
+    CREATE INDEX IF NOT EXISTS idx_filemetadata_number ON FileMetadata(PROPERTY_NAME_ID, NUMBER, FILE_ID)
+        WHERE NUMBER IS NOT NULL;
+'''
+
+# FileMetadata holds, for each file (the ROOT_ID of its SourceManifest
+# row), the content of its head meta elements and the values of its
+# Metadata nodes, under their names.  VALUE is the text as written, JSON
+# numbers and booleans in their JSON form, so "1.10" and "007" stay
+# distinct and match exactly.  NUMBER is the value read as a number, or
+# NULL when it is not one, for range filters.  Rows are clustered by name
+# and value, idx_filemetadata_number orders each name's numbers, and
+# idx_filemetadata_file finds a file's values by name, so a filter on
+# several names starts from one indexed range and checks the others file
+# by file instead of joining Objects to itself:
+#
+#   SELECT s.SOURCE_FILE
+#   FROM FileMetadata a JOIN SourceManifest s ON s.ROOT_ID = a.FILE_ID
+#   WHERE a.PROPERTY_NAME_ID = (SELECT ID FROM PropertyName WHERE NAME = 'author') AND a.VALUE = 'X'
+#     AND EXISTS (SELECT 1 FROM FileMetadata v
+#                 WHERE v.FILE_ID = a.FILE_ID AND v.NUMBER >= 3
+#                   AND v.PROPERTY_NAME_ID = (SELECT ID FROM PropertyName WHERE NAME = 'version'))
+
+# Text FileMetadata.NUMBER reads as a number, surrounding spaces aside
+NUMBER_PATTERN = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+
+def facet_number(value):
+    """The FileMetadata NUMBER for value: value itself, what its text reads as, or None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    text = value.strip()
+    if not NUMBER_PATTERN.fullmatch(text):
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+OBJECTS_VIEW_SQL = '''
+    CREATE VIEW IF NOT EXISTS "Objects" AS
+        SELECT o.ID, p.NAME AS PROPERTY_NAME, o.RELATED_ID, o.INTEGER_VALUE, o.TEXT_VALUE, o.BOOLEAN_VALUE,
+               o.BLOB_VALUE, o.REAL_VALUE, o.NUMERIC_VALUE
+        FROM ObjectData o LEFT JOIN PropertyName p ON p.ID = o.PROPERTY_NAME_ID;
+'''
+
+def scan_directory(directory, extension):
+    """The files with extension directly in directory and the subdirectories to walk, both in os.walk order."""
+    files = []
+    subdirectories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    if entry.name.endswith(extension):
+                        files.append(entry.path)
+                elif not entry.is_symlink():
+                    subdirectories.append(entry.path)
+    except OSError:
+        pass
+    return files, subdirectories
+
+def find_files(directory, extension, workers=0):
+    """Yield the files with extension under directory, in os.walk order.
+
+    With workers, directories are listed on that many threads, each as soon
+    as its parent has been listed, which pays off on slow or network drives.
+    """
+    if workers <= 0:
+        pending = [directory]
+        while pending:
+            files, subdirectories = scan_directory(pending.pop(), extension)
+            yield from files
+            pending.extend(reversed(subdirectories))
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def scan(directory):
+            files, subdirectories = scan_directory(directory, extension)
+            return files, [pool.submit(scan, subdirectory) for subdirectory in subdirectories]
+
+        pending = [pool.submit(scan, directory)]
+        while pending:
+            files, subdirectories = pending.pop().result()
+            yield from files
+            pending.extend(reversed(subdirectories))
+
+class Extractor():
+    """The Objects rows for one file, with IDs numbered from 0.
+
+    The writer moves them to the ID range it leases for the file, so the
+    rows can be extracted in a worker process.
+    """
+    def __init__(self, skip_fields):
+        self.skip_fields = skip_fields
+        self.rows = []
+        # (name, value, number) of the file's meta elements and Metadata values, for FileMetadata
+        self.facets = []
+        # Metadata and Material nodes found, by type
+        self.found = Counter()
+        self.id = -1
 
     def genId(self):
         self.id += 1
         return self.id
 
-ID = IdGen()
+    def addRow(self, object_id, property_name, column, value):
+        self.rows.append((object_id, property_name, COLUMN_NUMBERS[column], value))
 
-def grabMetadata(data, parent):
+    def addFacet(self, name, value):
+        if isinstance(value, (str, int, float)):
+            text = value if isinstance(value, str) else json.dumps(value)
+            self.facets.append((name, text, facet_number(value)))
 
-    if isinstance(data, (tuple, list)):
-        for d in data:
-            # print(f"{d}\n\n")
-            grabMetadata(d, parent)
-    elif isinstance(data, str):
-        #print(f"{data}\n\n")
-        pass
-    elif isinstance(data, int):
-        #print(f"{data}\n\n")
-        pass
-    elif isinstance(data, float):
-        #print(f"{data}\n\n")
-        pass
-    elif isinstance(data, object):
+    def grabMetadata(self, data, parent):
+        """Record Metadata and Material nodes found anywhere under data.
+
+        Walks with an explicit stack of lazy frames instead of recursing, so
+        deep Transform/Group hierarchies cannot hit the recursion limit.  IDs
+        are still handed out in the same depth-first order.
+        """
+        stack = [iter([(data, parent)])]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
+            data, parent = item
+            if isinstance(data, (tuple, list)):
+                stack.append(zip(data, repeat(parent)))
+            elif isinstance(data, (str, int, float)):
+                pass
+            elif isinstance(data, object):
+                stack.append(self.metadataChildren(data, parent))
+            else:
+                print(f"{data}\n\n")
+
+    def metadataChildren(self, data, parent):
+        """Record the Metadata and Material nodes directly in object data.
+
+        Yields (value, id) for every child grabMetadata still has to walk;
+        fields in skip_fields are not walked.  Every key takes an ID, in
+        order, whether or not it is a node or walked.
+        """
+        addRow = self.addRow
         for d in data:
-            try:
-                if d.startswith("Metadata"):
-                    name = data[d]['@name']
-                    try:
-                        mvalue = data[d]['-value']
-                    except KeyError:
-                        mvalue = None
-                    try:
-                        svalue = data[d]['@value']
-                    except KeyError:
-                        svalue = None
-                    setid = ID.genId()
-                    result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, TEXT_VALUE)  VALUES (?, ?, ?)", (parent, 'name', name))
-                elif d == "Material":
-                    setid = ID.genId()
-                else:
-                    setId = ID.genId()
-                    grabMetadata(data[d], setId)
-                if d == "Material":
-                    try:
-                        diffuseColor = data[d]['@diffuseColor']
-                        result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'diffuseColor', setid))
-                        for (c, component) in enumerate(diffuseColor):
-                            if c == 0:
-                                result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, INTEGER_VALUE)  VALUES (?, ?, ?)", (setid, 'red', component))
-                            elif c == 1:
-                                result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, INTEGER_VALUE)  VALUES (?, ?, ?)", (setid, 'green', component))
-                            elif c == 2:
-                                result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, INTEGER_VALUE)  VALUES (?, ?, ?)", (setid, 'blue', component))
-                            elif c == 3:
-                                result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, INTEGER_VALUE)  VALUES (?, ?, ?)", (setid, 'alpha', component))
-                    except KeyError:
-                        diffuseColor = None
-                elif d == "MetadataSet":
-                    # print(f"{d} {name} {mvalue} {svalue}")
-                    result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'metadataset', setid))
-                    grabMetadata(data[d], setid)
-                elif d == "MetadataInteger":
-                    # print(f"{d} {name} {mvalue} {svalue}")
-                    if svalue is not None:
-                        if isinstance(svalue, list):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                            for (s, sv) in enumerate(svalue):
-                                result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, INTEGER_VALUE)  VALUES (?, ?, ?)", (setid, s, sv))
-                        else:
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, INTEGER_VALUE)  VALUES (?, ?, ?)", (parent, name, svalue))
-                    elif mvalue is not None:
-                        result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                        for (m, mv) in enumerate(mvalue):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, INTEGER_VALUE)  VALUES (?, ?, ?)", (setid, m, mv))
-                elif d == "MetadataDouble":
-                    # print(f"{d} {name} {mvalue} {svalue}")
-                    if svalue is not None:
-                        if isinstance(svalue, list):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                            for (s, sv) in enumerate(svalue):
-                                result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, REAL_VALUE)  VALUES (?, ?, ?)", (setid, s, sv))
-                        else:
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, REAL_VALUE)  VALUES (?, ?, ?)", (parent, name, svalue))
-                    elif mvalue is not None:
-                        result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                        for (m, mv) in enumerate(mvalue):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, REAL_VALUE)  VALUES (?, ?, ?)", (setid, m, mv))
-                elif d == "MetadataFloat":
-                    # print(f"{d} {name} {mvalue} {svalue}")
-                    if svalue is not None:
-                        if isinstance(svalue, list):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                            for (s, sv) in enumerate(svalue):
-                                result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, REAL_VALUE)  VALUES (?, ?, ?)", (setid, s, sv))
-                        else:
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, REAL_VALUE)  VALUES (?, ?, ?)", (parent, name, svalue))
-                    elif mvalue is not None:
-                        result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                        for (m, mv) in enumerate(mvalue):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, REAL_VALUE)  VALUES (?, ?, ?)", (setid, m, mv))
-                elif d == "MetadataString":
-                    # print(f"{d} {name} {mvalue} {svalue}")
-                    if svalue is not None:
-                        if isinstance(svalue, list):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                            for (s, sv) in enumerate(svalue):
-                                result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, TEXT_VALUE)  VALUES (?, ?, ?)", (setid, s, sv))
-                        else:
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, TEXT_VALUE)  VALUES (?, ?, ?)", (parent, name, svalue))
-                    elif mvalue is not None:
-                        result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                        for (m, mv) in enumerate(mvalue):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, TEXT_VALUE)  VALUES (?, ?, ?)", (setid, m, mv))
-                elif d == "MetadataBoolean":
-                    # print(f"{d} {name} {mvalue} {svalue}")
-                    if svalue is not None:
-                        if isinstance(svalue, list):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                            for (s, sv) in enumerate(svalue):
-                                result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, BOOLEAN_VALUE)  VALUES (?, ?, ?)", (setid, s, 'true' if sv else 'false'))
-                        else:
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, BOOLEAN_VALUE)  VALUES (?, ?, ?)", (parent, name, 'true' if svalue else 'false'))
-                    elif mvalue is not None:
-                        result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'array', setid))
-                        for (m, mv) in enumerate(mvalue):
-                            result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, BOOLEAN_VALUE)  VALUES (?, ?, ?)", (setid, m, 'true' if mv else 'false'))
-            except KeyError:
-                nextId = ID.genId()
-                grabMetadata(data[d], nextId)
-    else:
-        print(f"{data}\n\n")
+            node = data[d]
+            if d.startswith("Metadata"):
+                self.found[d] += 1
+                try:
+                    name = node['@name']
+                except KeyError:
+                    yield node, self.genId()
+                    continue
+                setid = self.genId()
+                addRow(parent, 'name', "TEXT_VALUE", name)
+                if d == "MetadataSet":
+                    addRow(parent, 'metadataset', "RELATED_ID", setid)
+                    yield node, setid
+                elif d in METADATA_VALUES:
+                    column, convert = METADATA_VALUES[d]
+                    svalue = node.get('@value')
+                    if svalue is not None and not isinstance(svalue, list):
+                        value = convert(svalue) if convert else svalue
+                        addRow(parent, name, column, value)
+                        self.addFacet(name, value)
+                        continue
+                    # A list in @value, or else -value, is stored as an array under setid
+                    values = svalue if svalue is not None else node.get('-value')
+                    if values is not None:
+                        addRow(parent, 'array', "RELATED_ID", setid)
+                        for index, value in enumerate(map(convert, values) if convert else values):
+                            addRow(setid, index, column, value)
+                            self.addFacet(name, value)
+            elif d == "Material":
+                self.found[d] += 1
+                setid = self.genId()
+                diffuseColor = node.get('@diffuseColor')
+                if diffuseColor is not None:
+                    addRow(parent, 'diffuseColor', "RELATED_ID", setid)
+                    for component, value in zip(COLOR_COMPONENTS, diffuseColor):
+                        addRow(setid, component, "INTEGER_VALUE", value)
+            else:
+                childid = self.genId()
+                if d not in self.skip_fields:
+                    yield node, childid
 
-for file_path in find_files("C:\\Users\\jcarl\\www.web3d.org\\x3d\\content\\examples\\", ".json"):
-    parent = ID.genId()
-    result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, TEXT_VALUE)  VALUES (?, ?, ?)", (parent, 'filename', file_path))
+def extract_file(file_path, skip_fields, quick_check=False):
+    """Read one file's Objects rows; runs in a worker process with --workers.
+
+    Returns (file_path, id_count, rows, facets, found): rows use IDs 0 to
+    id_count - 1, 0 being the file's own, facets are its FileMetadata
+    (name, value, number) rows, and found counts its Metadata and Material nodes
+    by type.
+    """
+    extractor = Extractor(skip_fields)
+    parent = extractor.genId()
+    extractor.addRow(parent, 'filename', "TEXT_VALUE", file_path)
     with open(file_path, 'r') as f:
+        text = f.read()
+    # Without any of the keys there is nothing to record, so the file need not be parsed
+    if not quick_check or any(key in text for key in QUICK_CHECK_KEYS):
         try:
-            data = json.load(f)
+            data = json.loads(text)
             try:
                 metas = data['X3D']['head']['meta']
                 for meta in metas:
                     name = meta['@name']
                     content = meta['@content']
-                    id = ID.genId()
-                    result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, RELATED_ID)  VALUES (?, ?, ?)", (parent, 'meta', id))
-                    result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, TEXT_VALUE)  VALUES (?, ?, ?)", (id, 'name', name))
-                    result = cursor.execute("INSERT INTO Objects (ID, PROPERTY_NAME, TEXT_VALUE)  VALUES (?, ?, ?)", (id, 'content', content))
+                    id = extractor.genId()
+                    extractor.addRow(parent, 'meta', "RELATED_ID", id)
+                    extractor.addRow(id, 'name', "TEXT_VALUE", name)
+                    extractor.addRow(id, 'content', "TEXT_VALUE", content)
+                    extractor.addFacet(name, content)
             except KeyError:
                 pass
-            grabMetadata(data, parent)
+            extractor.grabMetadata(data, parent)
         except json.decoder.JSONDecodeError:
             pass
-connection.commit()
-
-cursor.execute("SELECT * FROM Objects")
-for record in cursor.fetchall():
-    r = []
-    for field in record:
-        if field is not None:
-            r.append(field)
-    print(f"{r}")
-connection.close()
+    return file_path, extractor.id + 1, extractor.rows, extractor.facets, extractor.found
+
+def extract_files(file_paths, workers, skip_fields, quick_check=False):
+    """Extract files in a process pool, yielding extract_file results in input order.
+
+    At most two files per worker are in flight, so a slow writer holds
+    back the readers instead of piling extracted rows up in memory.
+    Results come back in input order, so IDs match a serial run.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for file_path in file_paths:
+            pending.append(pool.submit(extract_file, file_path, skip_fields, quick_check))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _drop(connection, name):
+    """Drop the table or view called name, if there is one."""
+    row = connection.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    if row is not None:
+        connection.execute(f'DROP {row[0].upper()} "{name}"')
+
+def create_database(db_path, reset=True):
+    """Open the database and set up the current schema.
+
+    With reset=False the rows are kept, for --incremental, and a database
+    from before PropertyName is upgraded in place; one from before the
+    current FileMetadata has its files read again.
+    """
+    connection = sqlite3.connect(db_path)
+    if reset:
+        for name in ("SourceManifest", "IdAllocator", "FileMetadata", "Objects", "ObjectData", "PropertyName"):
+            _drop(connection, name)
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version < 4:
+        # Version 3 had FileMetadata values in one NUMERIC column; it is filled again below
+        _drop(connection, "FileMetadata")
+    connection.executescript(OBJECTS_SQL)
+    if version < 2 and connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Objects'").fetchone():
+        # Rows keep their order, so the Objects view reads back as the table did
+        connection.executescript('''
+            INSERT OR IGNORE INTO PropertyName (NAME)
+            SELECT PROPERTY_NAME FROM Objects GROUP BY PROPERTY_NAME ORDER BY MIN(rowid);
+
+            INSERT INTO ObjectData (ID, PROPERTY_NAME_ID, RELATED_ID, INTEGER_VALUE, TEXT_VALUE, BOOLEAN_VALUE,
+                                    BLOB_VALUE, REAL_VALUE, NUMERIC_VALUE)
+            SELECT o.ID, p.ID, o.RELATED_ID, o.INTEGER_VALUE, o.TEXT_VALUE, o.BOOLEAN_VALUE,
+                   o.BLOB_VALUE, o.REAL_VALUE, o.NUMERIC_VALUE
+            FROM Objects o JOIN PropertyName p ON p.NAME = o.PROPERTY_NAME
+            ORDER BY o.rowid;
+
+            DROP TABLE Objects;
+        ''')
+    if version < 4 and connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'SourceManifest'").fetchone():
+        # FileMetadata is filled as files are read, so have the files read before it read again
+        connection.execute("UPDATE SourceManifest SET SIZE = -1, CONTENT_HASH = ''")
+    connection.executescript(OBJECTS_VIEW_SQL)
+    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    connection.commit()
+    return connection
+
+class PropertyNames():
+    """PropertyName IDs by name, adding names the first time they are seen."""
+    def __init__(self, connection):
+        self.connection = connection
+        self.ids = dict(connection.execute("SELECT NAME, ID FROM PropertyName"))
+
+    def id(self, name):
+        try:
+            return self.ids[name]
+        except KeyError:
+            pass
+        # Array positions are int names, stored as text like the rest
+        self.connection.execute("INSERT OR IGNORE INTO PropertyName (NAME) VALUES (?)", (name,))
+        name_id = self.connection.execute("SELECT ID FROM PropertyName WHERE NAME = ?", (name,)).fetchone()[0]
+        self.ids[name] = name_id
+        return name_id
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect X3D meta and Metadata nodes into ThreeDimAssets.sqlite3")
+    parser.add_argument("directory", nargs="?", default="C:\\Users\\jcarl\\www.web3d.org\\x3d\\content\\examples\\",
+                        help="directory searched for .json files")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep the existing Objects rows and only re-read files that changed")
+    parser.add_argument("--skip-fields", default=",".join(DEFAULT_SKIP_FIELDS),
+                        help="comma-separated X3D fields whose values are not searched for nodes "
+                             "(default: %(default)s; empty to search everything)")
+    parser.add_argument("--quick-check", action="store_true",
+                        help="don't parse files whose text has no meta, Metadata or Material key")
+    parser.add_argument("--workers", type=int, default=0, metavar="N",
+                        help="list directories on N threads and parse files in N worker processes; "
+                             "this process stays the only writer")
+    args = parser.parse_args()
+    skip_fields = frozenset(field for field in args.skip_fields.split(",") if field)
+
+    connection = create_database("ThreeDimAssets.sqlite3", reset=not args.incremental)
+
+    manifest = SourceManifest(connection)
+    # FileMetadata.FILE_ID is a ROOT_ID, so this finds the file it belongs to
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_sourcemanifest_root ON SourceManifest(ROOT_ID)')
+    # Objects IDs, leased in blocks so other writers of the database get different ones
+    object_ids = IdAllocator(connection, "Objects")
+
+    property_names = PropertyNames(connection)
+
+    cursor = connection.cursor()
+
+    def forget(file_path):
+        """Delete the rows read from file_path on an earlier run."""
+        recorded = manifest.get(file_path)
+        if recorded is not None:
+            cursor.execute("DELETE FROM ObjectData WHERE ID BETWEEN ? AND ?", recorded)
+            cursor.execute("DELETE FROM FileMetadata WHERE FILE_ID = ?", recorded[:1])
+            manifest.remove(file_path)
+
+    if args.incremental:
+        for file_path in manifest.missing():
+            forget(file_path)
+        connection.commit()
+
+    fingerprints = {}
+
+    def changed_files():
+        for file_path in find_files(args.directory, ".json", args.workers):
+            fingerprint = manifest.check(file_path)
+            if fingerprint is None:
+                continue
+            fingerprints[file_path] = fingerprint
+            yield file_path
+
+    if args.workers > 0:
+        extracted = extract_files(changed_files(), args.workers, skip_fields, args.quick_check)
+    else:
+        extracted = (extract_file(file_path, skip_fields, args.quick_check) for file_path in changed_files())
+
+    found = Counter()
+    for file_path, id_count, rows, facets, file_found in extracted:
+        # The lease commits on its own, so each file's rows then go in one
+        # transaction of their own, over an ID range no other writer has
+        first = object_ids.take(id_count)
+        forget(file_path)
+        property_name_id = property_names.id
+        cursor.executemany(INSERT_OBJECT, [
+            (object_id + first, property_name_id(property_name), column,
+             value + first if column == RELATED_ID else value)
+            for object_id, property_name, column, value in rows
+        ])
+        cursor.executemany("INSERT OR IGNORE INTO FileMetadata (PROPERTY_NAME_ID, VALUE, FILE_ID, NUMBER) "
+                           "VALUES (?, ?, ?, ?)",
+                           [(property_name_id(name), value, first, number) for name, value, number in facets])
+        manifest.record(file_path, fingerprints.pop(file_path), first, first + id_count - 1)
+        connection.commit()
+        found.update(file_found)
+
+    cursor.execute("SELECT * FROM Objects")
+    for record in cursor.fetchall():
+        r = []
+        for field in record:
+            if field is not None:
+                r.append(field)
+        print(f"{r}")
+    connection.close()
+
+    for node_type, count in sorted(found.items()):
+        print(f"{node_type}: {count}")
+
+if __name__ == "__main__":
+    main()
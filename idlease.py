@@ -0,0 +1,118 @@
+"""Block-leased IDs, so several writers can share one database.
+
+A writer that numbers rows from MAX(ID) + 1 read at startup collides with
+any other writer that started at the same time.  The IdAllocator table
+instead keeps, for each table, the first ID nobody has leased yet.  A
+writer leases a block of consecutive IDs with one UPDATE and hands them
+out from memory; the next block is leased when it runs out.  IDs left in
+a block when a writer stops are never used, so IDs can have gaps.
+
+Each lease is its own short BEGIN IMMEDIATE ... COMMIT, so it holds
+SQLite's write lock only for the lease itself.  A transaction the caller
+has open on the connection is committed first: SQLite has one write
+lock, and a lease cannot commit while the caller's writes hold it.
+Callers that need a group of rows to commit together lease their IDs
+before writing them.
+
+Every writer must take its IDs from here: an INSERT that lets SQLite
+pick MAX(ID) + 1 can take an ID another writer has leased.
+"""
+import sqlite3
+
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+DEFAULT_BLOCK_SIZE = 1000
+
+# Blocks double from block_size up to this many times it, so a long run
+# leases, and commits, less often while a short one leaves a small gap
+MAX_BLOCK_GROWTH = 16
+
+class IdAllocator:
+    """IDs for the rows of one table, leased from the IdAllocator table a block at a time.
+
+    The table's IdAllocator row is created by its first lease, starting
+    after the largest ID already in the table.
+    """
+
+    def __init__(self, connection, table, block_size=DEFAULT_BLOCK_SIZE):
+        self.connection = connection
+        self.table = table
+        self.block_size = max(1, block_size)
+        self.max_block_size = self.block_size * MAX_BLOCK_GROWTH
+        # The current block is next_id up to, not including, limit
+        self.next_id = self.limit = 0
+        # IDs handed out by next(), which is the number of rows written with them
+        self.issued = 0
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS "IdAllocator" (
+                "NAME" TEXT PRIMARY KEY,
+                "NEXT_ID" INTEGER NOT NULL
+            )
+        ''')
+
+    def lease(self, count):
+        """Reserve count consecutive IDs in a transaction of their own and return the first."""
+        connection = self.connection
+        connection.commit()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            end = self._advance(count)
+            if end is None:
+                # First lease for this table: start after the rows it already has
+                connection.execute(
+                    f'INSERT OR IGNORE INTO IdAllocator (NAME, NEXT_ID) SELECT ?, IFNULL(MAX(ID), 0) + 1 FROM "{self.table}"',
+                    (self.table,)
+                )
+                end = self._advance(count)
+            connection.commit()
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+        return end - count
+
+    def _advance(self, count):
+        # NEXT_ID after moving it on by count, or None if the table has no row yet
+        if SQLITE_HAS_RETURNING:
+            rows = self.connection.execute(
+                "UPDATE IdAllocator SET NEXT_ID = NEXT_ID + ? WHERE NAME = ? RETURNING NEXT_ID", (count, self.table)
+            ).fetchall()
+            return rows[0][0] if rows else None
+        if self.connection.execute("UPDATE IdAllocator SET NEXT_ID = NEXT_ID + ? WHERE NAME = ?",
+                                   (count, self.table)).rowcount == 0:
+            return None
+        return self.connection.execute("SELECT NEXT_ID FROM IdAllocator WHERE NAME = ?", (self.table,)).fetchone()[0]
+
+    def reserve(self):
+        """The ID next() will return, leasing a block if the current one is used up."""
+        if self.next_id >= self.limit:
+            self.next_id = self.lease(self.block_size)
+            self.limit = self.next_id + self.block_size
+            self.block_size = min(self.block_size * 2, self.max_block_size)
+        return self.next_id
+
+    def next(self):
+        """Hand out the next ID of the current block."""
+        row_id = self.reserve()
+        self.next_id += 1
+        self.issued += 1
+        return row_id
+
+    def take(self, count):
+        """Hand out count consecutive IDs and return the first.
+
+        They come from the current block if it has room.  Otherwise a new
+        block of at least count IDs is leased; when it follows straight on
+        from the current one, because no other writer leased in between,
+        the run starts in the current block's remainder, so no IDs are
+        skipped.
+        """
+        if self.limit - self.next_id < count:
+            size = max(count, self.block_size)
+            first = self.lease(size)
+            if first != self.limit:
+                self.next_id = first
+            self.limit = first + size
+        first = self.next_id
+        self.next_id += count
+        self.issued += count
+        return first
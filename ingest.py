@@ -0,0 +1,1900 @@
+"""Shared ingest engine for the insert*.py scripts.
+
+The scripts differ only in how a JSON member or array element becomes
+Entity and Relationship rows.  Each of those conventions is a visitor
+class here; EntityManager walks a document once, without recursion, and
+hands every member to its visitor.  Decoded documents and jsonstream
+event streams go through the same walker.
+"""
+import sqlite3
+import os
+import sys
+import json
+import math
+import random
+import hashlib
+import logging
+import argparse
+from collections import Counter, OrderedDict, deque
+from array import array
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+from jsonstream import iter_events
+from manifest import UNFINISHED, SourceManifest
+from instrument import IngestStats
+from packedarray import ARRAY_TYPE_NAMES, PackedArray, pack_arrays
+from arraystore import ArrayStore, sidecar_path
+from idlease import DEFAULT_BLOCK_SIZE, IdAllocator
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Edge kinds the visitors write; RelationshipType starts with these IDs
+RELATIONSHIP_TYPES = {
+    "HAS_PROPERTY": 1,
+    "ARRAY_ELEMENT": 2,
+    "HAS_VALUE": 3,
+}
+
+# File paths and edge kinds repeat on nearly every row, so EntityData and
+# the relationship tables store small integer keys into SourceFile and
+# RelationshipType instead.  The Entity and Relationship views put the
+# text back as SOURCE_FILE and RELATIONSHIP_TYPE for queries, and inserts
+# and deletes through them go to the tables.
+#
+# By default EntityData keeps each scalar in the column of its type.
+ENTITY_SQL = '''
+    CREATE TABLE IF NOT EXISTS "EntityData" (
+        "ID" INTEGER PRIMARY KEY,
+        "TYPE_ID" INTEGER NOT NULL,
+        "INTEGER_VALUE" INTEGER,
+        "TEXT_VALUE" TEXT,
+        "BOOLEAN_VALUE" INTEGER,
+        "BLOB_VALUE" BLOB,
+        "REAL_VALUE" REAL,
+        "NUMERIC_VALUE" NUMERIC,
+        "SOURCE_FILE_ID" INTEGER,
+        FOREIGN KEY ("TYPE_ID") REFERENCES "EntityType" ("ID"),
+        FOREIGN KEY ("SOURCE_FILE_ID") REFERENCES "SourceFile" ("ID")
+    );
+
+    CREATE VIEW IF NOT EXISTS "Entity" AS
+        SELECT e.ID, e.TYPE_ID, e.INTEGER_VALUE, e.TEXT_VALUE, e.BOOLEAN_VALUE, e.BLOB_VALUE,
+               e.REAL_VALUE, e.NUMERIC_VALUE, f.PATH AS SOURCE_FILE
+        FROM EntityData e LEFT JOIN SourceFile f ON f.ID = e.SOURCE_FILE_ID;
+
+    CREATE TRIGGER IF NOT EXISTS entity_insert INSTEAD OF INSERT ON "Entity"
+    BEGIN
+        INSERT OR IGNORE INTO SourceFile (PATH) VALUES (NEW.SOURCE_FILE);
+        INSERT INTO EntityData (ID, TYPE_ID, INTEGER_VALUE, TEXT_VALUE, BOOLEAN_VALUE, BLOB_VALUE,
+                                REAL_VALUE, NUMERIC_VALUE, SOURCE_FILE_ID)
+        VALUES (NEW.ID, NEW.TYPE_ID, NEW.INTEGER_VALUE, NEW.TEXT_VALUE, NEW.BOOLEAN_VALUE, NEW.BLOB_VALUE,
+                NEW.REAL_VALUE, NEW.NUMERIC_VALUE, (SELECT ID FROM SourceFile WHERE PATH = NEW.SOURCE_FILE));
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS entity_update INSTEAD OF UPDATE ON "Entity"
+    BEGIN
+        INSERT OR IGNORE INTO SourceFile (PATH) VALUES (NEW.SOURCE_FILE);
+        UPDATE EntityData
+        SET ID = NEW.ID, TYPE_ID = NEW.TYPE_ID, INTEGER_VALUE = NEW.INTEGER_VALUE, TEXT_VALUE = NEW.TEXT_VALUE,
+            BOOLEAN_VALUE = NEW.BOOLEAN_VALUE, BLOB_VALUE = NEW.BLOB_VALUE, REAL_VALUE = NEW.REAL_VALUE,
+            NUMERIC_VALUE = NEW.NUMERIC_VALUE, SOURCE_FILE_ID = (SELECT ID FROM SourceFile WHERE PATH = NEW.SOURCE_FILE)
+        WHERE ID = OLD.ID;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS entity_delete INSTEAD OF DELETE ON "Entity"
+    BEGIN
+        DELETE FROM EntityData WHERE ID = OLD.ID;
+    END;
+
+    -- Indexes for better performance
+    CREATE INDEX IF NOT EXISTS idx_entity_type ON EntityData(TYPE_ID);
+
+    -- Finds everything ingested from one file when it changes
+    CREATE INDEX IF NOT EXISTS idx_entity_source_file ON EntityData(SOURCE_FILE_ID);
+
+    -- One value per primitive type, so interning is a single index probe
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_entity_integer_value ON EntityData(INTEGER_VALUE) WHERE TYPE_ID = 1;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_entity_text_value ON EntityData(TEXT_VALUE) WHERE TYPE_ID = 2;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_entity_boolean_value ON EntityData(BOOLEAN_VALUE) WHERE TYPE_ID = 3;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_entity_blob_value ON EntityData(BLOB_VALUE) WHERE TYPE_ID = 4;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_entity_real_value ON EntityData(REAL_VALUE) WHERE TYPE_ID = 5;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_entity_numeric_value ON EntityData(NUMERIC_VALUE) WHERE TYPE_ID = 6;
+'''
+
+# The VALUE layout (--value-column): one untyped VALUE column holds any
+# scalar with its own SQLite storage class, and a single (TYPE_ID, VALUE)
+# index interns all primitive types.  Packed arrays keep their payload,
+# or its offset in the sidecar file, in VALUE and their length in
+# ELEMENT_COUNT.  The Entity view still shows the per-type columns, plus
+# VALUE.
+VALUE_ENTITY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS "{table}" (
+        "ID" INTEGER PRIMARY KEY,
+        "TYPE_ID" INTEGER NOT NULL,
+        "VALUE",
+        "ELEMENT_COUNT" INTEGER,
+        "SOURCE_FILE_ID" INTEGER,
+        FOREIGN KEY ("TYPE_ID") REFERENCES "EntityType" ("ID"),
+        FOREIGN KEY ("SOURCE_FILE_ID") REFERENCES "SourceFile" ("ID")
+    );
+'''
+
+def _value_of(row):
+    """SQL for the VALUE of a row in the per-type columns, row being a prefix such as "NEW."."""
+    return (f"CASE {row}TYPE_ID WHEN 1 THEN {row}INTEGER_VALUE WHEN 2 THEN {row}TEXT_VALUE "
+            f"WHEN 3 THEN {row}BOOLEAN_VALUE WHEN 4 THEN {row}BLOB_VALUE WHEN 5 THEN {row}REAL_VALUE "
+            f"WHEN 6 THEN {row}NUMERIC_VALUE ELSE IFNULL({row}BLOB_VALUE, {row}NUMERIC_VALUE) END")
+
+def _element_count_of(row):
+    """SQL for the ELEMENT_COUNT of a row in the per-type columns."""
+    return f"CASE WHEN {row}TYPE_ID >= 10 THEN {row}INTEGER_VALUE END"
+
+VALUE_ENTITY_SQL = VALUE_ENTITY_TABLE_SQL.format(table="EntityData") + f'''
+    CREATE VIEW IF NOT EXISTS "Entity" AS
+        SELECT e.ID, e.TYPE_ID,
+               CASE WHEN e.TYPE_ID = 1 THEN e.VALUE WHEN e.TYPE_ID >= 10 THEN e.ELEMENT_COUNT END AS INTEGER_VALUE,
+               CASE WHEN e.TYPE_ID = 2 THEN e.VALUE END AS TEXT_VALUE,
+               CASE WHEN e.TYPE_ID = 3 THEN e.VALUE END AS BOOLEAN_VALUE,
+               CASE WHEN e.TYPE_ID = 4 OR (e.TYPE_ID >= 10 AND typeof(e.VALUE) = 'blob')
+                    THEN e.VALUE END AS BLOB_VALUE,
+               CASE WHEN e.TYPE_ID = 5 THEN e.VALUE END AS REAL_VALUE,
+               CASE WHEN e.TYPE_ID = 6 OR (e.TYPE_ID >= 10 AND typeof(e.VALUE) = 'integer')
+                    THEN e.VALUE END AS NUMERIC_VALUE,
+               f.PATH AS SOURCE_FILE, e.VALUE
+        FROM EntityData e LEFT JOIN SourceFile f ON f.ID = e.SOURCE_FILE_ID;
+
+    -- Accepts either VALUE or the per-type columns
+    CREATE TRIGGER IF NOT EXISTS entity_insert INSTEAD OF INSERT ON "Entity"
+    BEGIN
+        INSERT OR IGNORE INTO SourceFile (PATH) VALUES (NEW.SOURCE_FILE);
+        INSERT INTO EntityData (ID, TYPE_ID, VALUE, ELEMENT_COUNT, SOURCE_FILE_ID)
+        VALUES (NEW.ID, NEW.TYPE_ID, IFNULL(NEW.VALUE, {_value_of("NEW.")}), {_element_count_of("NEW.")},
+                (SELECT ID FROM SourceFile WHERE PATH = NEW.SOURCE_FILE));
+    END;
+
+    -- A changed VALUE wins; otherwise the value comes from the per-type columns
+    CREATE TRIGGER IF NOT EXISTS entity_update INSTEAD OF UPDATE ON "Entity"
+    BEGIN
+        INSERT OR IGNORE INTO SourceFile (PATH) VALUES (NEW.SOURCE_FILE);
+        UPDATE EntityData
+        SET ID = NEW.ID, TYPE_ID = NEW.TYPE_ID,
+            VALUE = CASE WHEN NEW.VALUE IS NOT OLD.VALUE THEN NEW.VALUE ELSE {_value_of("NEW.")} END,
+            ELEMENT_COUNT = {_element_count_of("NEW.")},
+            SOURCE_FILE_ID = (SELECT ID FROM SourceFile WHERE PATH = NEW.SOURCE_FILE)
+        WHERE ID = OLD.ID;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS entity_delete INSTEAD OF DELETE ON "Entity"
+    BEGIN
+        DELETE FROM EntityData WHERE ID = OLD.ID;
+    END;
+
+    CREATE INDEX IF NOT EXISTS idx_entity_type ON EntityData(TYPE_ID);
+    CREATE INDEX IF NOT EXISTS idx_entity_source_file ON EntityData(SOURCE_FILE_ID);
+
+    -- One value per primitive type, all types in one index
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_entity_value ON EntityData(TYPE_ID, VALUE) WHERE TYPE_ID <= 6;
+'''
+
+# Relationships in a rowid table (the default)
+RELATIONSHIP_SQL = '''
+    CREATE TABLE IF NOT EXISTS "RelationshipData" (
+        "ID" INTEGER PRIMARY KEY AUTOINCREMENT,
+        "SOURCE_ID" INTEGER NOT NULL,
+        "PROPERTY_ID" INTEGER,
+        "TARGET_ID" INTEGER,
+        "RELATIONSHIP_TYPE_ID" INTEGER NOT NULL,
+        -- Position of an ARRAY_ELEMENT edge's target in its array; PROPERTY_ID is then NULL
+        "ORDINAL" INTEGER,
+        -- A scalar stored on the edge itself (--inline-scalars); TARGET_ID is then NULL
+        "TARGET_VALUE",
+        -- For an edge from an interned value, the object or array it was written for
+        "OWNER_ID" INTEGER,
+        FOREIGN KEY ("SOURCE_ID") REFERENCES "EntityData" ("ID"),
+        FOREIGN KEY ("PROPERTY_ID") REFERENCES "EntityData" ("ID"),
+        FOREIGN KEY ("TARGET_ID") REFERENCES "EntityData" ("ID"),
+        FOREIGN KEY ("RELATIONSHIP_TYPE_ID") REFERENCES "RelationshipType" ("ID"),
+        FOREIGN KEY ("OWNER_ID") REFERENCES "EntityData" ("ID")
+    );
+
+    -- Also reads an array back in order with one range scan
+    CREATE INDEX IF NOT EXISTS idx_relationship_source_ordinal ON RelationshipData(SOURCE_ID, ORDINAL);
+    CREATE INDEX IF NOT EXISTS idx_relationship_property ON RelationshipData(PROPERTY_ID);
+    CREATE INDEX IF NOT EXISTS idx_relationship_target ON RelationshipData(TARGET_ID);
+    CREATE INDEX IF NOT EXISTS idx_relationship_type ON RelationshipData(RELATIONSHIP_TYPE_ID);
+    -- Only the few edges with an owner, for deleting them with it
+    CREATE INDEX IF NOT EXISTS idx_relationship_owner ON RelationshipData(OWNER_ID) WHERE OWNER_ID IS NOT NULL;
+
+    -- TARGET_TYPE_ID and TARGET_VALUE read the same for inline and interned targets
+    CREATE VIEW IF NOT EXISTS "Relationship" AS
+        SELECT r.ID, r.SOURCE_ID, r.PROPERTY_ID, r.TARGET_ID, t.NAME AS RELATIONSHIP_TYPE, r.ORDINAL,
+               IFNULL(e.TYPE_ID, {inline_type_id}) AS TARGET_TYPE_ID,
+               IFNULL(r.TARGET_VALUE, {target_value}) AS TARGET_VALUE
+        FROM RelationshipData r LEFT JOIN RelationshipType t ON t.ID = r.RELATIONSHIP_TYPE_ID
+             LEFT JOIN EntityData e ON e.ID = r.TARGET_ID;
+
+    CREATE TRIGGER IF NOT EXISTS relationship_insert INSTEAD OF INSERT ON "Relationship"
+    BEGIN
+        INSERT OR IGNORE INTO RelationshipType (NAME) VALUES (NEW.RELATIONSHIP_TYPE);
+        INSERT INTO RelationshipData (ID, SOURCE_ID, PROPERTY_ID, TARGET_ID, RELATIONSHIP_TYPE_ID, ORDINAL,
+                                      TARGET_VALUE)
+        VALUES (NEW.ID, NEW.SOURCE_ID, NEW.PROPERTY_ID, NEW.TARGET_ID,
+                (SELECT ID FROM RelationshipType WHERE NAME = NEW.RELATIONSHIP_TYPE), NEW.ORDINAL,
+                CASE WHEN NEW.TARGET_ID IS NULL THEN NEW.TARGET_VALUE END);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS relationship_update INSTEAD OF UPDATE ON "Relationship"
+    BEGIN
+        INSERT OR IGNORE INTO RelationshipType (NAME) VALUES (NEW.RELATIONSHIP_TYPE);
+        UPDATE RelationshipData
+        SET ID = NEW.ID, SOURCE_ID = NEW.SOURCE_ID, PROPERTY_ID = NEW.PROPERTY_ID, TARGET_ID = NEW.TARGET_ID,
+            RELATIONSHIP_TYPE_ID = (SELECT ID FROM RelationshipType WHERE NAME = NEW.RELATIONSHIP_TYPE),
+            ORDINAL = NEW.ORDINAL, TARGET_VALUE = CASE WHEN NEW.TARGET_ID IS NULL THEN NEW.TARGET_VALUE END
+        WHERE ID = OLD.ID;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS relationship_delete INSTEAD OF DELETE ON "Relationship"
+    BEGIN
+        DELETE FROM RelationshipData WHERE ID = OLD.ID;
+    END;
+'''
+
+# The clustered layout (--clustered): edges live in a WITHOUT ROWID table
+# ordered by (SOURCE_ID, PROPERTY_ID, ORDINAL), so an entity's children
+# share pages and a subtree walk reads them sequentially rather than with
+# a rowid lookup each.  Key columns cannot be NULL, so a missing
+# PROPERTY_ID or ORDINAL is stored as 0 (no entity has ID 0), and ID tells
+# repeated edges apart.  The Relationship view is the same as above.
+CLUSTERED_RELATIONSHIP_SQL = '''
+    CREATE TABLE IF NOT EXISTS "RelationshipClustered" (
+        "SOURCE_ID" INTEGER NOT NULL,
+        "PROPERTY_ID" INTEGER NOT NULL,
+        "ORDINAL" INTEGER NOT NULL,
+        "ID" INTEGER NOT NULL,
+        "TARGET_ID" INTEGER,
+        "RELATIONSHIP_TYPE_ID" INTEGER NOT NULL,
+        "TARGET_VALUE",
+        "OWNER_ID" INTEGER,
+        PRIMARY KEY ("SOURCE_ID", "PROPERTY_ID", "ORDINAL", "ID"),
+        FOREIGN KEY ("SOURCE_ID") REFERENCES "EntityData" ("ID"),
+        FOREIGN KEY ("TARGET_ID") REFERENCES "EntityData" ("ID"),
+        FOREIGN KEY ("RELATIONSHIP_TYPE_ID") REFERENCES "RelationshipType" ("ID"),
+        FOREIGN KEY ("OWNER_ID") REFERENCES "EntityData" ("ID")
+    ) WITHOUT ROWID;
+
+    -- Covers finding an entity's parents: entries carry the key columns too
+    CREATE INDEX IF NOT EXISTS idx_relationship_clustered_target ON RelationshipClustered(TARGET_ID);
+    -- The view's PROPERTY_ID expression, so WHERE PROPERTY_ID = ? on the view uses it
+    CREATE INDEX IF NOT EXISTS idx_relationship_clustered_property
+        ON RelationshipClustered(NULLIF(PROPERTY_ID, 0));
+    CREATE INDEX IF NOT EXISTS idx_relationship_clustered_type ON RelationshipClustered(RELATIONSHIP_TYPE_ID);
+    CREATE INDEX IF NOT EXISTS idx_relationship_clustered_owner
+        ON RelationshipClustered(OWNER_ID) WHERE OWNER_ID IS NOT NULL;
+
+    CREATE VIEW IF NOT EXISTS "Relationship" AS
+        SELECT r.ID, r.SOURCE_ID, NULLIF(r.PROPERTY_ID, 0) AS PROPERTY_ID, r.TARGET_ID,
+               t.NAME AS RELATIONSHIP_TYPE, CASE WHEN r.PROPERTY_ID = 0 THEN r.ORDINAL END AS ORDINAL,
+               IFNULL(e.TYPE_ID, {inline_type_id}) AS TARGET_TYPE_ID,
+               IFNULL(r.TARGET_VALUE, {target_value}) AS TARGET_VALUE
+        FROM RelationshipClustered r LEFT JOIN RelationshipType t ON t.ID = r.RELATIONSHIP_TYPE_ID
+             LEFT JOIN EntityData e ON e.ID = r.TARGET_ID;
+
+    -- EntityManager numbers its own rows; MAX(ID) is a full scan, fine for the odd manual insert
+    CREATE TRIGGER IF NOT EXISTS relationship_insert INSTEAD OF INSERT ON "Relationship"
+    BEGIN
+        INSERT OR IGNORE INTO RelationshipType (NAME) VALUES (NEW.RELATIONSHIP_TYPE);
+        INSERT INTO RelationshipClustered (SOURCE_ID, PROPERTY_ID, ORDINAL, ID, TARGET_ID, RELATIONSHIP_TYPE_ID,
+                                           TARGET_VALUE)
+        VALUES (NEW.SOURCE_ID, IFNULL(NEW.PROPERTY_ID, 0), IFNULL(NEW.ORDINAL, 0),
+                IFNULL(NEW.ID, (SELECT IFNULL(MAX(ID), 0) + 1 FROM RelationshipClustered)),
+                NEW.TARGET_ID, (SELECT ID FROM RelationshipType WHERE NAME = NEW.RELATIONSHIP_TYPE),
+                CASE WHEN NEW.TARGET_ID IS NULL THEN NEW.TARGET_VALUE END);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS relationship_update INSTEAD OF UPDATE ON "Relationship"
+    BEGIN
+        INSERT OR IGNORE INTO RelationshipType (NAME) VALUES (NEW.RELATIONSHIP_TYPE);
+        UPDATE RelationshipClustered
+        SET SOURCE_ID = NEW.SOURCE_ID, PROPERTY_ID = IFNULL(NEW.PROPERTY_ID, 0), ORDINAL = IFNULL(NEW.ORDINAL, 0),
+            ID = NEW.ID, TARGET_ID = NEW.TARGET_ID,
+            RELATIONSHIP_TYPE_ID = (SELECT ID FROM RelationshipType WHERE NAME = NEW.RELATIONSHIP_TYPE),
+            TARGET_VALUE = CASE WHEN NEW.TARGET_ID IS NULL THEN NEW.TARGET_VALUE END
+        WHERE SOURCE_ID = OLD.SOURCE_ID AND PROPERTY_ID = IFNULL(OLD.PROPERTY_ID, 0)
+          AND ORDINAL = IFNULL(OLD.ORDINAL, 0) AND ID = OLD.ID;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS relationship_delete INSTEAD OF DELETE ON "Relationship"
+    BEGIN
+        DELETE FROM RelationshipClustered
+        WHERE SOURCE_ID = OLD.SOURCE_ID AND PROPERTY_ID = IFNULL(OLD.PROPERTY_ID, 0)
+          AND ORDINAL = IFNULL(OLD.ORDINAL, 0) AND ID = OLD.ID;
+    END;
+'''
+
+# Scalar types --inline-scalars may store on edges.  Each has its own
+# storage class, so an inline value's type is told by typeof().
+INLINE_TYPES = {
+    "INTEGER": 1,
+    "TEXT": 2,
+    "BLOB": 4,
+    "REAL": 5,
+}
+
+def relationship_sql(clustered, value_layout):
+    """The SQL for a relationship layout, its view reading interned targets' values from the entity layout."""
+    inline_type_id = ("CASE typeof(r.TARGET_VALUE) " +
+                      " ".join(f"WHEN '{name.lower()}' THEN {type_id}" for name, type_id in INLINE_TYPES.items()) +
+                      " END")
+    return (CLUSTERED_RELATIONSHIP_SQL if clustered else RELATIONSHIP_SQL).format(
+        inline_type_id=inline_type_id, target_value="e.VALUE" if value_layout else _value_of("e."))
+
+def relationship_table(connection):
+    """The table holding the database's relationships, or None if it has none yet."""
+    row = connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('RelationshipData', 'RelationshipClustered')"
+    ).fetchone()
+    return row[0] if row else None
+
+def has_value_column(connection):
+    """Whether EntityData is in the VALUE layout of VALUE_ENTITY_SQL."""
+    return any(row[1] == "VALUE" for row in connection.execute('PRAGMA table_info("EntityData")'))
+
+def migrate_value_column(connection, batch_size=50000):
+    """Convert EntityData to the VALUE layout in place, while the database stays in use.
+
+    The rows are copied to EntityData_new batch_size IDs per transaction,
+    so other connections can read and write between batches; triggers on
+    EntityData mirror their changes into the copy meanwhile.  The copy
+    then replaces EntityData in one short transaction, and its unique
+    index is built there with one sort.  An interrupted migration starts
+    over on the next call.
+    """
+    connection.commit()
+    new_row = f"NEW.ID, NEW.TYPE_ID, {_value_of('NEW.')}, {_element_count_of('NEW.')}, NEW.SOURCE_FILE_ID"
+    connection.executescript(VALUE_ENTITY_TABLE_SQL.format(table="EntityData_new") + f'''
+        CREATE TRIGGER IF NOT EXISTS entity_migrate_insert AFTER INSERT ON EntityData
+        BEGIN
+            INSERT OR REPLACE INTO EntityData_new (ID, TYPE_ID, VALUE, ELEMENT_COUNT, SOURCE_FILE_ID)
+            VALUES ({new_row});
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS entity_migrate_update AFTER UPDATE ON EntityData
+        BEGIN
+            DELETE FROM EntityData_new WHERE ID = OLD.ID;
+            INSERT OR REPLACE INTO EntityData_new (ID, TYPE_ID, VALUE, ELEMENT_COUNT, SOURCE_FILE_ID)
+            VALUES ({new_row});
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS entity_migrate_delete AFTER DELETE ON EntityData
+        BEGIN
+            DELETE FROM EntityData_new WHERE ID = OLD.ID;
+        END;
+    ''')
+
+    # Rows written from here on reach EntityData_new through the triggers
+    max_id = connection.execute("SELECT IFNULL(MAX(ID), 0) FROM EntityData").fetchone()[0]
+    for low in range(0, max_id, batch_size):
+        connection.execute(
+            "INSERT OR IGNORE INTO EntityData_new (ID, TYPE_ID, VALUE, ELEMENT_COUNT, SOURCE_FILE_ID) "
+            f"SELECT ID, TYPE_ID, {_value_of('')}, {_element_count_of('')}, SOURCE_FILE_ID FROM EntityData "
+            "WHERE ID > ? AND ID <= ?",
+            (low, low + batch_size)
+        )
+        connection.commit()
+
+    # Dropping EntityData takes its indexes and the triggers with it.  The
+    # views read EntityData's columns, so they are recreated too.
+    table = relationship_table(connection)
+    connection.execute('PRAGMA foreign_keys = OFF')
+    try:
+        connection.executescript(f'''
+            BEGIN IMMEDIATE;
+            DROP VIEW IF EXISTS "Entity";
+            DROP VIEW IF EXISTS "Relationship";
+            DROP TABLE EntityData;
+            ALTER TABLE EntityData_new RENAME TO EntityData;
+            {VALUE_ENTITY_SQL}
+            {relationship_sql(table == "RelationshipClustered", True) if table is not None else ""}
+            COMMIT;
+        ''')
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    finally:
+        connection.execute('PRAGMA foreign_keys = ON')
+    logger.info("Converted EntityData to the VALUE layout")
+
+def _drop(connection, name):
+    """Drop the table or view called name, if there is one."""
+    row = connection.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    if row is not None:
+        connection.execute(f'DROP {row[0].upper()} "{name}"')
+
+def _set_aside_legacy_tables(connection):
+    """Rename the tables of a database from before SourceFile and RelationshipType to *_old.
+
+    Returns the old relationship table and whether the database used the
+    clustered layout, for _copy_legacy_rows().
+    """
+    connection.commit()
+    connection.execute('PRAGMA foreign_keys = OFF')
+    # Keep references to the old names as they are; the renamed tables are dropped after the copy
+    connection.execute('PRAGMA legacy_alter_table = ON')
+    clustered = connection.execute(
+        "SELECT type = 'view' FROM sqlite_master WHERE name = 'Relationship'"
+    ).fetchone() == (1,)
+    if clustered:
+        connection.execute('DROP VIEW "Relationship"')
+    old_relationship_table = "RelationshipClustered" if clustered else "Relationship"
+    for name in ("Entity", "SubtreeHash", old_relationship_table):
+        if not connection.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone():
+            continue
+        # Index names are global, so the new tables' indexes would otherwise exist already
+        indexes = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (name,)
+        ).fetchall()
+        for (index,) in indexes:
+            connection.execute(f'DROP INDEX "{index}"')
+        connection.execute(f'ALTER TABLE "{name}" RENAME TO "{name}_old"')
+    connection.execute('PRAGMA legacy_alter_table = OFF')
+    return old_relationship_table + "_old", clustered
+
+def _copy_legacy_rows(connection, old_relationship_table, new_relationship_table):
+    """Copy the rows set aside by _set_aside_legacy_tables() into the current tables and drop the old ones."""
+    columns = [row[1] for row in connection.execute(f'PRAGMA table_info("{old_relationship_table}")')]
+    if old_relationship_table == "RelationshipClustered_old":
+        old_edges = '''
+            SELECT ID, SOURCE_ID, NULLIF(PROPERTY_ID, 0) AS PROPERTY_ID, TARGET_ID, RELATIONSHIP_TYPE,
+                   CASE WHEN PROPERTY_ID = 0 THEN ORDINAL END AS ORDINAL
+            FROM RelationshipClustered_old
+        '''
+    elif "ORDINAL" in columns:
+        old_edges = "SELECT ID, SOURCE_ID, PROPERTY_ID, TARGET_ID, RELATIONSHIP_TYPE, ORDINAL FROM Relationship_old"
+    else:
+        # Array positions were INTEGER entities referenced by PROPERTY_ID.  The
+        # entities themselves stay, as other rows may use them as values.
+        old_edges = '''
+            SELECT r.ID, r.SOURCE_ID,
+                   CASE WHEN r.RELATIONSHIP_TYPE = 'ARRAY_ELEMENT' THEN NULL ELSE r.PROPERTY_ID END AS PROPERTY_ID,
+                   r.TARGET_ID, r.RELATIONSHIP_TYPE,
+                   CASE WHEN r.RELATIONSHIP_TYPE = 'ARRAY_ELEMENT' THEN p.INTEGER_VALUE END AS ORDINAL
+            FROM Relationship_old r LEFT JOIN Entity_old p ON p.ID = r.PROPERTY_ID
+        '''
+    if new_relationship_table == "RelationshipClustered":
+        copy_edges = f'''
+            INSERT INTO RelationshipClustered (SOURCE_ID, PROPERTY_ID, ORDINAL, ID, TARGET_ID, RELATIONSHIP_TYPE_ID)
+            SELECT o.SOURCE_ID, IFNULL(o.PROPERTY_ID, 0), IFNULL(o.ORDINAL, 0), o.ID, o.TARGET_ID, t.ID
+            FROM ({old_edges}) o JOIN RelationshipType t ON t.NAME = o.RELATIONSHIP_TYPE
+        '''
+    else:
+        copy_edges = f'''
+            INSERT INTO RelationshipData (ID, SOURCE_ID, PROPERTY_ID, TARGET_ID, RELATIONSHIP_TYPE_ID, ORDINAL)
+            SELECT o.ID, o.SOURCE_ID, o.PROPERTY_ID, o.TARGET_ID, t.ID, o.ORDINAL
+            FROM ({old_edges}) o JOIN RelationshipType t ON t.NAME = o.RELATIONSHIP_TYPE
+            ORDER BY o.ID
+        '''
+    copy_hashes = ""
+    if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'SubtreeHash_old'").fetchone():
+        copy_hashes = '''
+            INSERT INTO SubtreeHash (ENTITY_ID, HASH, REFCOUNT) SELECT ENTITY_ID, HASH, REFCOUNT FROM SubtreeHash_old;
+            DROP TABLE SubtreeHash_old;
+        '''
+    connection.executescript(f'''
+        INSERT OR IGNORE INTO SourceFile (PATH)
+        SELECT SOURCE_FILE FROM Entity_old WHERE SOURCE_FILE IS NOT NULL GROUP BY SOURCE_FILE ORDER BY MIN(ID);
+
+        INSERT INTO EntityData (ID, TYPE_ID, INTEGER_VALUE, TEXT_VALUE, BOOLEAN_VALUE, BLOB_VALUE,
+                                REAL_VALUE, NUMERIC_VALUE, SOURCE_FILE_ID)
+        SELECT e.ID, e.TYPE_ID, e.INTEGER_VALUE, e.TEXT_VALUE, e.BOOLEAN_VALUE, e.BLOB_VALUE,
+               e.REAL_VALUE, e.NUMERIC_VALUE, f.ID
+        FROM Entity_old e LEFT JOIN SourceFile f ON f.PATH = e.SOURCE_FILE
+        ORDER BY e.ID;
+
+        INSERT OR IGNORE INTO RelationshipType (NAME) SELECT DISTINCT RELATIONSHIP_TYPE FROM {old_relationship_table};
+        {copy_edges};
+
+        {copy_hashes}
+        DROP TABLE {old_relationship_table};
+        DROP TABLE Entity_old;
+    ''')
+    connection.execute('PRAGMA foreign_keys = ON')
+    logger.info("Upgraded the database: source files and relationship types moved to lookup tables")
+
+def create_database(db_path="EntityRelationship.sqlite3", reset=True, clustered=False, value_column=False):
+    """Create and set up the SQLite database with improved schema.
+
+    With reset=False existing tables and rows are kept, for incremental
+    ingest, and so is their layout.  clustered=True lays relationships out
+    as in CLUSTERED_RELATIONSHIP_SQL.  value_column=True stores entities
+    as in VALUE_ENTITY_SQL, converting an existing database with
+    migrate_value_column().
+    """
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA foreign_keys = ON')
+
+    legacy = None
+    value_layout = value_column
+    if reset:
+        # Drop tables and views if they exist, referring rows first
+        for name in ("SourceManifest", "IdAllocator", "SubtreeHash", "Relationship", "RelationshipData",
+                     "RelationshipClustered", "Entity", "EntityData", "EntityData_new", "SourceFile",
+                     "RelationshipType", "EntityType"):
+            _drop(connection, name)
+    elif connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Entity'").fetchone():
+        # Databases from before the lookup tables are upgraded in place
+        legacy, clustered = _set_aside_legacy_tables(connection)
+        value_layout = False
+    else:
+        table = relationship_table(connection)
+        if table is not None:
+            clustered = table == "RelationshipClustered"
+            if not any(row[1] == "TARGET_VALUE" for row in connection.execute(f'PRAGMA table_info("{table}")')):
+                # From before inline scalars: the view is recreated below with the new columns
+                _drop(connection, "Relationship")
+                connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "TARGET_VALUE"')
+            if not any(row[1] == "OWNER_ID" for row in connection.execute(f'PRAGMA table_info("{table}")')):
+                # From before edge owners; edges written until now have none
+                connection.execute(
+                    f'ALTER TABLE "{table}" ADD COLUMN "OWNER_ID" INTEGER REFERENCES "EntityData" ("ID")'
+                )
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'EntityData'").fetchone():
+            value_layout = has_value_column(connection)
+
+    # Create tables with improved schema
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS "EntityType" (
+            "ID" INTEGER PRIMARY KEY,
+            "NAME" TEXT NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS "SourceFile" (
+            "ID" INTEGER PRIMARY KEY,
+            "PATH" TEXT NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS "RelationshipType" (
+            "ID" INTEGER PRIMARY KEY,
+            "NAME" TEXT NOT NULL UNIQUE
+        );
+
+        -- Objects and arrays shared by content (--dedup), with the number of edges to each
+        CREATE TABLE IF NOT EXISTS "SubtreeHash" (
+            "ENTITY_ID" INTEGER PRIMARY KEY,
+            "HASH" BLOB NOT NULL UNIQUE,
+            "REFCOUNT" INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY ("ENTITY_ID") REFERENCES "EntityData" ("ID")
+        );
+    ''')
+    connection.executescript(VALUE_ENTITY_SQL if value_layout else ENTITY_SQL)
+    connection.executescript(relationship_sql(clustered, value_layout))
+
+    # Pre-populate entity types
+    entity_types = [
+        (1, "INTEGER"),
+        (2, "TEXT"),
+        (3, "BOOLEAN"),
+        (4, "BLOB"),
+        (5, "REAL"),
+        (6, "NUMERIC"),
+        (7, "OBJECT"),
+        (8, "ARRAY"),
+        (9, "NULL"),
+        *ARRAY_TYPE_NAMES.items()
+    ]
+
+    connection.executemany("INSERT OR IGNORE INTO EntityType (ID, NAME) VALUES (?, ?)", entity_types)
+    connection.executemany("INSERT OR IGNORE INTO RelationshipType (NAME, ID) VALUES (?, ?)",
+                           RELATIONSHIP_TYPES.items())
+    if legacy is not None:
+        _copy_legacy_rows(connection, legacy, relationship_table(connection))
+    connection.commit()
+    if value_column and not value_layout:
+        migrate_value_column(connection)
+
+    return connection
+
+# Indexes only queries need.  The unique value indexes are not listed: the
+# upsert in EntityManager relies on them while loading.
+SECONDARY_INDEXES = (
+    "idx_entity_type",
+    "idx_entity_source_file",
+    "idx_relationship_source_ordinal",
+    "idx_relationship_property",
+    "idx_relationship_target",
+    "idx_relationship_type",
+    "idx_relationship_owner",
+    "idx_relationship_clustered_target",
+    "idx_relationship_clustered_property",
+    "idx_relationship_clustered_type",
+    "idx_relationship_clustered_owner",
+)
+
+@contextmanager
+def bulk_load(connection):
+    """Session mode for initial loads into a fresh database.
+
+    Journal and sync settings are relaxed, foreign keys are not enforced
+    and the secondary indexes are dropped for the duration.  On leaving,
+    the indexes are rebuilt (one sort each instead of a B-tree insert per
+    row), foreign keys are checked once and ANALYZE is run.  Yields a
+    report dict that is filled with the foreign key violations found.
+    """
+    connection.commit()
+    journal_mode = connection.execute('PRAGMA journal_mode').fetchone()[0]
+    synchronous = connection.execute('PRAGMA synchronous').fetchone()[0]
+    connection.execute('PRAGMA journal_mode = MEMORY')
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.execute('PRAGMA temp_store = MEMORY')
+    connection.execute('PRAGMA foreign_keys = OFF')
+
+    placeholders = ", ".join("?" * len(SECONDARY_INDEXES))
+    deferred = connection.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name IN ({placeholders})",
+        SECONDARY_INDEXES
+    ).fetchall()
+    for name, _ in deferred:
+        connection.execute(f'DROP INDEX "{name}"')
+    connection.commit()
+
+    report = {"violations": []}
+    try:
+        yield report
+    finally:
+        connection.commit()
+        logger.info(f"Rebuilding {len(deferred)} indexes")
+        for _, sql in deferred:
+            connection.execute(sql)
+        connection.commit()
+
+        connection.execute(f'PRAGMA journal_mode = {journal_mode}')
+        connection.execute(f'PRAGMA synchronous = {synchronous}')
+        connection.execute('PRAGMA foreign_keys = ON')
+
+        violations = connection.execute('PRAGMA foreign_key_check').fetchall()
+        report["violations"] = violations
+        if violations:
+            for (table, parent), count in Counter((row[0], row[2]) for row in violations).items():
+                logger.warning(f"Foreign key check: {count} {table} rows reference missing {parent} rows")
+        else:
+            logger.info("Foreign key check: no violations")
+
+        connection.execute('ANALYZE')
+        connection.commit()
+
+class InternCache:
+    """Bounded LRU map from (type id, value) to the ID of the interned Entity."""
+
+    # Rough per-entry cost of the key tuple, the ID and the OrderedDict node
+    ENTRY_OVERHEAD = 160
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _entry_size(self, key):
+        return self.ENTRY_OVERHEAD + sys.getsizeof(key[1])
+
+    def get(self, key):
+        """Return the cached entity ID for key, or None on a miss."""
+        entity_id = self.entries.get(key)
+        if entity_id is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entity_id
+
+    def put(self, key, entity_id):
+        """Remember an entity ID, evicting least recently used keys past the cap."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.entries[key] = entity_id
+            return
+        self.entries[key] = entity_id
+        self.size += self._entry_size(key)
+        while self.size > self.max_bytes and self.entries:
+            old_key, _ = self.entries.popitem(last=False)
+            self.size -= self._entry_size(old_key)
+            self.evictions += 1
+
+    def discard(self, key):
+        """Forget key, if it is cached."""
+        if self.entries.pop(key, None) is not None:
+            self.size -= self._entry_size(key)
+
+    def is_full(self):
+        return self.size >= self.max_bytes
+
+class BloomFilter:
+    """Fixed-size Bloom filter over interned (type id, value) keys.
+
+    add_if_new() never answers True for a key that was added before, so
+    a True means the value was never interned and needs no lookup.  The
+    filter is blocked: a key's hash picks one 64-bit word and one of
+    PATTERNS precomputed masks with hash_count bits set, so a probe is a
+    single word test instead of hash_count scattered ones.  The filter
+    takes max_bytes whatever is added; error_rate sets hash_count, and
+    holds until about capacity keys are in.  Beyond that the false
+    positive rate climbs, which costs lookups but never correctness.
+    Keys hash with hash(), so a filter is only valid in the process that
+    built it.
+    """
+
+    PATTERNS = 4096
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, error_rate=0.01):
+        self.word_count = max(1, int(max_bytes) // 8)
+        self.max_bytes = self.word_count * 8
+        self.error_rate = error_rate
+        self.words = array("Q", bytes(self.max_bytes))
+        # log2(1 / p) bits per key is optimal for p in a classic filter
+        self.hash_count = max(1, min(16, round(-math.log2(error_rate))))
+        patterns = random.Random(0)
+        self.masks = [sum(1 << bit for bit in patterns.sample(range(64), self.hash_count))
+                      for _ in range(self.PATTERNS)]
+        self.capacity = self._capacity()
+        self.count = 0
+        self.negatives = 0
+        self.positives = 0
+        self.false_positives = 0
+
+    def __len__(self):
+        return self.count
+
+    def _probe(self, key):
+        # hash() of tuples holding floats is poorly spread in its low bits,
+        # so mix it and split the high bits: the top 32 pick the word, the
+        # next 12 the mask
+        h = (hash(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return ((h >> 32) * self.word_count) >> 32, self.masks[(h >> 20) & 0xFFF]
+
+    def add(self, key):
+        index, mask = self._probe(key)
+        self.words[index] |= mask
+        self.count += 1
+
+    def add_if_new(self, key):
+        """Add key and return True if it was certainly not in yet; False, adding nothing, if it might be."""
+        index, mask = self._probe(key)
+        word = self.words[index]
+        if word & mask == mask:
+            self.positives += 1
+            return False
+        self.words[index] = word | mask
+        self.count += 1
+        self.negatives += 1
+        return True
+
+    def _error_rate(self, key_count):
+        # Keys per word are Poisson distributed; a probe fails if its word has all the mask's bits set
+        load = key_count / self.word_count
+        term = math.exp(-load)
+        rate = 0.0
+        keys = 0
+        while keys <= load or term > 1e-12:
+            rate += term * (1 - (63 / 64) ** (self.hash_count * keys)) ** self.hash_count
+            keys += 1
+            term *= load / keys
+        return rate
+
+    def _capacity(self):
+        low, high = 0, self.word_count * 64
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._error_rate(middle) <= self.error_rate:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def estimated_error_rate(self):
+        """The false positive rate expected with the keys added so far."""
+        return self._error_rate(self.count)
+
+    def observed_error_rate(self):
+        """The false positive rate seen so far: false positives per probe of a key not added before."""
+        absent = self.negatives + self.false_positives
+        return self.false_positives / absent if absent else 0.0
+
+def iter_tree_events(document):
+    """Yield jsonstream events for an already decoded document, without recursion."""
+    stack = []  # (is object, iterator over the remaining members or elements)
+    value = document
+    while True:
+        if isinstance(value, dict):
+            yield "start_object", None
+            stack.append((True, iter(value.items())))
+        elif isinstance(value, list):
+            yield "start_array", None
+            stack.append((False, iter(value)))
+        else:
+            yield "scalar", value
+
+        # Advance to the next value, closing every container that is finished
+        while stack:
+            is_object, items = stack[-1]
+            item = next(items, stack)
+            if item is stack:
+                stack.pop()
+                yield ("end_object" if is_object else "end_array"), None
+            elif is_object:
+                yield "key", item[0]
+                value = item[1]
+                break
+            else:
+                value = item
+                break
+        else:
+            return
+
+class PropertyVisitor:
+    """insert.py: object members are HAS_PROPERTY edges, array elements ARRAY_ELEMENT edges.
+
+    A visitor decides which rows one JSON member or array element becomes.
+    slot is the member name, or the array index when is_index is true.
+    """
+
+    # Primitive members are only ever edge targets, so they can be stored inline
+    inlines_scalars = True
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def begin_file(self, file_path):
+        """Create the root entity for a file, with its filename edge."""
+        manager = self.manager
+        root_entity_id = manager.create_entity(7, source_file=file_path)  # 7 = OBJECT
+        filename_prop_id = manager.get_or_create_entity("filename")
+        filename_value_id = manager.get_or_create_entity(file_path)
+        manager.create_relationship(root_entity_id, filename_prop_id, filename_value_id)
+        return root_entity_id
+
+    def enter(self, parent_id, slot, is_index, entity_type_id, source_file):
+        """Create the entity for a nested object or array.
+
+        Returns its ID and a token that is handed to leave() once the
+        container's contents have been processed (None to skip leave).
+        """
+        manager = self.manager
+        if is_index:
+            item_entity_id = manager.create_entity(entity_type_id, source_file=source_file)
+            manager.create_relationship(parent_id, None, item_entity_id, "ARRAY_ELEMENT", slot)
+            return item_entity_id, None
+        prop_entity_id = manager.get_or_create_entity(slot)
+        value_entity_id = manager.create_entity(entity_type_id, source_file=source_file)
+        manager.create_relationship(parent_id, prop_entity_id, value_entity_id)
+        return value_entity_id, None
+
+    def leave(self, token):
+        """Finish a container after its contents (post-order work)."""
+
+    def link(self, parent_id, slot, is_index, child_id, source_file):
+        """Connect an already written object or array to its parent.
+
+        Used instead of enter()/leave() when subtrees are deduplicated and a
+        container is only written, or found, once its contents are known.
+        """
+        manager = self.manager
+        if is_index:
+            manager.create_relationship(parent_id, None, child_id, "ARRAY_ELEMENT", slot)
+            return
+        prop_entity_id = manager.get_or_create_entity(slot)
+        manager.create_relationship(parent_id, prop_entity_id, child_id)
+
+    def scalar(self, parent_id, slot, is_index, value, source_file):
+        """Record a primitive member or array element."""
+        manager = self.manager
+        if is_index:
+            if value is None:
+                return
+            manager.create_value_relationship(parent_id, None, value, source_file, "ARRAY_ELEMENT", slot)
+            return
+        prop_entity_id = manager.get_or_create_entity(slot)
+        manager.create_value_relationship(parent_id, prop_entity_id, value, source_file)
+
+    def document_scalar(self, parent_id, value, source_file):
+        """Record a document that is a bare primitive rather than an object or array."""
+
+class ScalarRelationshipVisitor(PropertyVisitor):
+    """insertscalarrel.py: as insert.py, plus a HAS_VALUE edge from each property name to its value."""
+
+    def enter(self, parent_id, slot, is_index, entity_type_id, source_file):
+        if is_index:
+            return super().enter(parent_id, slot, is_index, entity_type_id, source_file)
+        manager = self.manager
+        prop_entity_id = manager.get_or_create_entity(slot)
+        value_entity_id = manager.create_entity(entity_type_id, source_file=source_file)
+        manager.create_relationship(parent_id, prop_entity_id, value_entity_id)
+        # The property-to-value edge follows the nested structure
+        return value_entity_id, (prop_entity_id, value_entity_id)
+
+    def leave(self, token):
+        prop_entity_id, value_entity_id = token
+        manager = self.manager
+        manager.create_relationship(prop_entity_id, manager.get_or_create_entity("value"), value_entity_id, "HAS_VALUE")
+
+    def link(self, parent_id, slot, is_index, child_id, source_file):
+        super().link(parent_id, slot, is_index, child_id, source_file)
+        if not is_index:
+            self.leave((self.manager.get_or_create_entity(slot), child_id))
+
+    def scalar(self, parent_id, slot, is_index, value, source_file):
+        if is_index:
+            super().scalar(parent_id, slot, is_index, value, source_file)
+            return
+        manager = self.manager
+        prop_entity_id = manager.get_or_create_entity(slot)
+        # Both edges point at the same target, so a null is created once
+        if type(value) in manager.inline_classes:
+            value_entity_id, inline_value = None, value
+        else:
+            value_entity_id, inline_value = manager.get_or_create_entity(value, source_file), None
+        manager.create_relationship(parent_id, prop_entity_id, value_entity_id, target_value=inline_value)
+        manager.create_relationship(prop_entity_id, manager.get_or_create_entity("value"), value_entity_id, "HAS_VALUE",
+                                    target_value=inline_value, owner_id=parent_id)
+
+class ValueVisitor(PropertyVisitor):
+    """insertjson.py: members are HAS_VALUE edges written after the value's own contents.
+
+    Every primitive array element also gets an ARRAY_ELEMENT edge from its
+    own entity, and names, indexes and values all carry the source file.
+    """
+
+    # value() hangs rows off each primitive's own entity, so primitives stay interned
+    inlines_scalars = False
+
+    def begin_file(self, file_path):
+        manager = self.manager
+        root_entity_id = manager.create_entity(7, source_file=file_path)  # 7 = OBJECT
+        filename_prop_id = manager.get_or_create_entity("filename", file_path)
+        filename_value_id = manager.get_or_create_entity(file_path, file_path)
+        manager.create_relationship(root_entity_id, filename_prop_id, filename_value_id)
+        return root_entity_id
+
+    def enter(self, parent_id, slot, is_index, entity_type_id, source_file):
+        value_entity_id = self.manager.create_entity(entity_type_id, source_file=source_file)
+        return value_entity_id, self.edge(parent_id, slot, is_index, value_entity_id, source_file)
+
+    def leave(self, token):
+        self.manager.create_relationship(*token)
+
+    def link(self, parent_id, slot, is_index, child_id, source_file):
+        self.leave(self.edge(parent_id, slot, is_index, child_id, source_file))
+
+    def edge(self, parent_id, slot, is_index, value_entity_id, source_file):
+        """Arguments for create_relationship() from a container to a member or element."""
+        if is_index:
+            return parent_id, None, value_entity_id, "ARRAY_ELEMENT", slot
+        return parent_id, self.manager.get_or_create_entity(slot, source_file), value_entity_id, "HAS_VALUE"
+
+    def scalar(self, parent_id, slot, is_index, value, source_file):
+        manager = self.manager
+        value_entity_id = manager.get_or_create_entity(value, source_file)
+        self.value(value, value_entity_id, source_file, slot if is_index else None, parent_id)
+        manager.create_relationship(*self.edge(parent_id, slot, is_index, value_entity_id, source_file))
+
+    def document_scalar(self, parent_id, value, source_file):
+        self.value(value, parent_id, source_file)
+
+    def value(self, obj, parent_id, source_file, array_index=None, owner_id=None):
+        """Rows hung off a primitive's own entity, owner_id being the object or array it is a member of."""
+        if obj is None or type(obj) is PackedArray:
+            return
+        if array_index is not None:
+            manager = self.manager
+            value_entity_id = manager.get_or_create_entity(obj, source_file)
+            manager.create_relationship(parent_id, None, value_entity_id, "ARRAY_ELEMENT", array_index,
+                                        owner_id=owner_id)
+
+class NullValueVisitor(ValueVisitor):
+    """insertjson2.py: as insertjson.py, but a null also gets a "null" HAS_VALUE edge to a NULL entity."""
+
+    def value(self, obj, parent_id, source_file, array_index=None, owner_id=None):
+        manager = self.manager
+        if type(obj) is PackedArray:
+            return
+        if obj is None:
+            null_entity_id = manager.get_or_create_entity(None, source_file)
+            prop_entity_id = manager.get_or_create_entity("null", source_file)
+            manager.create_relationship(parent_id, prop_entity_id, null_entity_id, "HAS_VALUE")
+            return
+        value_entity_id = manager.get_or_create_entity(obj, source_file)
+        if array_index is not None:
+            manager.create_relationship(parent_id, None, value_entity_id, "ARRAY_ELEMENT", array_index,
+                                        owner_id=owner_id)
+
+class EntityManager:
+    # Value column for each primitive entity type
+    VALUE_COLUMNS = {
+        1: "INTEGER_VALUE",
+        2: "TEXT_VALUE",
+        3: "BOOLEAN_VALUE",
+        4: "BLOB_VALUE",
+        5: "REAL_VALUE",
+        6: "NUMERIC_VALUE"
+    }
+
+    # Statements for each primitive type, built once.  The type ID is
+    # inlined in FIND_SQL so the planner can match the partial unique index.
+    FIND_SQL = {entity_type_id: f"SELECT ID FROM EntityData WHERE TYPE_ID = {entity_type_id} AND {column} = ?"
+                for entity_type_id, column in VALUE_COLUMNS.items()}
+    INSERT_SQL = {entity_type_id: f"INSERT INTO EntityData (ID, TYPE_ID, {column}, SOURCE_FILE_ID) VALUES (?, ?, ?, ?)"
+                  for entity_type_id, column in VALUE_COLUMNS.items()}
+
+    # The VALUE layout needs one of each; "TYPE_ID <= 6" matches its index's WHERE clause
+    VALUE_FIND_SQL = "SELECT ID FROM EntityData WHERE TYPE_ID = ? AND VALUE = ? AND TYPE_ID <= 6"
+    VALUE_INSERT_SQL = "INSERT INTO EntityData (ID, TYPE_ID, VALUE, SOURCE_FILE_ID) VALUES (?, ?, ?, ?)"
+
+    # How JSON members become rows; see PropertyVisitor
+    visitor_class = PropertyVisitor
+
+    def __init__(self, connection, cache_bytes=64 * 1024 * 1024, batch_size=10000, visitor_class=None, stats=None,
+                 dedup=False, pack_min_length=0, array_store=None, inline_types=(), bloom_bytes=0,
+                 bloom_error_rate=0.01, id_block_size=DEFAULT_BLOCK_SIZE):
+        self.connection = connection
+        self.visitor = (visitor_class or self.visitor_class)(self)
+        self.cursor = connection.cursor()
+        # Entity IDs come in blocks leased from IdAllocator, so other writers can share the database
+        self.entity_ids = IdAllocator(connection, "EntityData", id_block_size)
+        # Rows go straight to the tables behind the Entity and Relationship views
+        self.relationship_table = relationship_table(connection)
+        self.clustered = self.relationship_table == "RelationshipClustered"
+        if self.clustered:
+            # The clustered table has no rowid to number rows, so they are numbered here too
+            self.relationship_ids = IdAllocator(connection, "RelationshipClustered", id_block_size)
+        # Scalars in one VALUE column (--value-column) or the column of their type
+        self.value_column = has_value_column(connection)
+        if self.value_column:
+            self.insert_statements = dict.fromkeys(self.VALUE_COLUMNS, self.VALUE_INSERT_SQL)
+        else:
+            self.insert_statements = self.INSERT_SQL
+        # Queued interned values: a row another writer has interned meanwhile is skipped, see flush()
+        self.upsert_statements = {entity_type_id: statement.replace("INSERT", "INSERT OR IGNORE", 1)
+                                  for entity_type_id, statement in self.insert_statements.items()}
+        self.intern_cache = InternCache(cache_bytes)
+        # Optional filter over every interned key, so new values skip the lookup.  It is read
+        # once here; a value another writer interns later is caught when the row is written.
+        self.bloom_filter = BloomFilter(bloom_bytes, bloom_error_rate) if bloom_bytes else None
+        self.warm_cache()
+        self.manifest = SourceManifest(connection)
+
+        # Lookup table IDs: file path -> SourceFile ID, relationship type -> RelationshipType ID
+        self.source_file_ids = {}
+        self.relationship_type_ids = dict(connection.execute("SELECT NAME, ID FROM RelationshipType"))
+
+        # Write-behind buffer: INSERT statement -> parameter rows not yet written.
+        # Each flush is one transaction, so a batch is also what other writers wait for.
+        self.batch_size = max(1, batch_size)
+        self.pending = {}
+        self.pending_count = 0
+        # Interned values queued in pending: (type id, value) -> entity ID
+        self.queued_values = {}
+        # IDs of queued values another writer interned first -> the ID of its row
+        self.replaced_ids = {}
+
+        # Subtree deduplication: content hash -> entity ID, and SubtreeHash
+        # REFCOUNT increments not yet written
+        self.dedup = dedup
+        self.subtree_cache = InternCache(cache_bytes // 4)
+        self.refcount_deltas = Counter()
+        # Rows differ between visitors, so equal JSON only matches under the same one
+        self.hash_seed = type(self.visitor).__name__.encode()
+
+        # Numeric arrays of at least this many elements are stored packed; 0 disables
+        self.pack_min_length = pack_min_length
+        # Sidecar ArrayStore for packed payloads of at least its min_bytes, or None
+        self.array_store = array_store
+
+        # Python types of the scalars stored on their edges instead of interned (INLINE_TYPES IDs)
+        python_types = {1: int, 2: str, 4: bytes, 5: float}
+        self.inline_classes = frozenset(python_types[entity_type_id] for entity_type_id in inline_types)
+        if self.inline_classes and not self.visitor.inlines_scalars:
+            logger.warning(f"{type(self.visitor).__name__} keeps every scalar interned; ignoring inline types")
+            self.inline_classes = frozenset()
+
+        # Opt-in: an IngestStats wraps the hot methods of this instance only
+        self.stats = stats
+        if stats is not None:
+            stats.instrument(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        return False
+
+    def _queue(self, statement, row):
+        """Buffer one row for statement, flushing once a full batch is waiting."""
+        rows = self.pending.get(statement)
+        if rows is None:
+            rows = self.pending[statement] = []
+        rows.append(row)
+        self.pending_count += 1
+        if self.pending_count >= self.batch_size:
+            self.flush()
+
+    @staticmethod
+    def _write_order(statement):
+        # Entity rows first, then SubtreeHash, then the relationships between them
+        if "INTO Entity" in statement:
+            return 0
+        return 2 if "Relationship" in statement else 1
+
+    def flush(self):
+        """Write buffered rows with executemany, entities before the rows that refer to them, and commit.
+
+        Interned values are buffered like every other row, so the walk
+        between flushes only reads and other writers get the database
+        between batches.
+        """
+        interned = set(self.upsert_statements.values())
+        statements = sorted(self.pending, key=self._write_order)
+        for statement in statements:
+            rows = self.pending[statement]
+            if self.replaced_ids and "Relationship" in statement:
+                rows = self._redirect(statement, rows)
+            try:
+                written = self.cursor.executemany(statement, rows).rowcount
+                if statement in interned and written < len(rows):
+                    self._replace_lost(rows)
+            except sqlite3.Error as e:
+                if "Relationship" not in statement:
+                    raise
+                # Retry row by row so one bad relationship does not drop the batch
+                for row in rows:
+                    try:
+                        self.cursor.execute(statement, row)
+                    except sqlite3.Error as e:
+                        logger.error(f"Error creating relationship: {e}")
+        self.pending.clear()
+        self.pending_count = 0
+        self.queued_values.clear()
+
+        if self.array_store is not None:
+            self.array_store.flush()
+
+        if self.refcount_deltas:
+            self.cursor.executemany(
+                "UPDATE SubtreeHash SET REFCOUNT = REFCOUNT + ? WHERE ENTITY_ID = ?",
+                [(delta, entity_id) for entity_id, delta in self.refcount_deltas.items()]
+            )
+            self.refcount_deltas.clear()
+        self.connection.commit()
+
+    def _replace_lost(self, rows):
+        """Point the intern cache and later relationships at rows another writer interned before these."""
+        for entity_id, entity_type_id, stored, _ in rows:
+            found = self.find_entity(entity_type_id, stored)
+            if found != entity_id:
+                self.replaced_ids[entity_id] = found
+                self.intern_cache.put((entity_type_id, bool(stored) if entity_type_id == 3 else stored), found)
+
+    def _redirect(self, statement, rows):
+        """rows with the IDs in replaced_ids swapped for their replacements."""
+        columns = statement[statement.index("(") + 1:statement.index(")")].split(", ")
+        positions = {index for index, column in enumerate(columns)
+                     if column in ("SOURCE_ID", "PROPERTY_ID", "TARGET_ID")}
+        replaced = self.replaced_ids
+        return [tuple(replaced.get(field, field) if index in positions else field for index, field in enumerate(row))
+                for row in rows]
+
+    def warm_cache(self):
+        """Pre-load interned primitive values from the Entity table, oldest first.
+
+        With a Bloom filter every value is read, to add it to the filter;
+        otherwise reading stops once the cache is full.
+        """
+        bloom = self.bloom_filter
+        if self.value_column:
+            cursor = self.connection.execute(
+                "SELECT ID, TYPE_ID, VALUE FROM EntityData WHERE TYPE_ID <= 6 ORDER BY ID"
+            )
+        else:
+            cursor = self.connection.execute(
+                "SELECT ID, TYPE_ID, INTEGER_VALUE, TEXT_VALUE, BOOLEAN_VALUE, "
+                "BLOB_VALUE, REAL_VALUE, NUMERIC_VALUE FROM EntityData WHERE TYPE_ID <= 6 ORDER BY ID"
+            )
+        for entity_id, entity_type_id, *values in cursor:
+            full = self.intern_cache.is_full()
+            if full and bloom is None:
+                break
+            value = values[0] if self.value_column else values[entity_type_id - 1]
+            if entity_type_id == 3:  # BOOLEAN
+                value = bool(value)
+            key = (entity_type_id, value)
+            if bloom is not None:
+                bloom.add(key)
+            if not full:
+                self.intern_cache.put(key, entity_id)
+        cursor.close()
+
+    def get_entity_type_id(self, obj):
+        """Map Python types to entity type IDs."""
+        if obj is None:
+            return 9  # NULL
+        if type(obj) is PackedArray:
+            return obj.entity_type_id  # INT32_ARRAY, INT64_ARRAY or FLOAT64_ARRAY
+
+        type_mapping = {
+            int: 1,      # INTEGER
+            str: 2,      # TEXT
+            bool: 3,     # BOOLEAN
+            bytes: 4,    # BLOB
+            float: 5,    # REAL
+            dict: 7,     # OBJECT
+            list: 8      # ARRAY
+        }
+
+        return type_mapping.get(type(obj), 2)  # Default to TEXT for unknown types
+
+    def generate_id(self):
+        """Generate a new unique ID."""
+        return self.entity_ids.next()
+
+    def find_entity(self, entity_type_id, value):
+        """Find an entity by type and value."""
+        if entity_type_id not in self.VALUE_COLUMNS:
+            return None
+
+        # Convert boolean to integer for storage
+        if entity_type_id == 3:  # BOOLEAN
+            value = 1 if value else 0
+
+        if self.value_column:
+            self.cursor.execute(self.VALUE_FIND_SQL, (entity_type_id, value))
+        else:
+            self.cursor.execute(self.FIND_SQL[entity_type_id], (value,))
+        result = self.cursor.fetchone()
+        return result[0] if result else None
+
+    def source_file_id(self, file_path):
+        """The SourceFile ID for file_path, adding the path the first time it is seen."""
+        if file_path is None:
+            return None
+        source_file_id = self.source_file_ids.get(file_path)
+        if source_file_id is None:
+            self.cursor.execute("INSERT OR IGNORE INTO SourceFile (PATH) VALUES (?)", (file_path,))
+            self.cursor.execute("SELECT ID FROM SourceFile WHERE PATH = ?", (file_path,))
+            source_file_id = self.source_file_ids[file_path] = self.cursor.fetchone()[0]
+        return source_file_id
+
+    def relationship_type_id(self, relationship_type):
+        """The RelationshipType ID for relationship_type, adding the name the first time it is seen."""
+        relationship_type_id = self.relationship_type_ids.get(relationship_type)
+        if relationship_type_id is None:
+            self.cursor.execute("INSERT OR IGNORE INTO RelationshipType (NAME) VALUES (?)", (relationship_type,))
+            self.cursor.execute("SELECT ID FROM RelationshipType WHERE NAME = ?", (relationship_type,))
+            relationship_type_id = self.relationship_type_ids[relationship_type] = self.cursor.fetchone()[0]
+        return relationship_type_id
+
+    def upsert_entity(self, entity_type_id, value, source_file=None):
+        """Return the ID of the primitive entity equal to value, queueing a new one if there is none."""
+        entity_id = self.find_entity(entity_type_id, value)
+        if entity_id is None:
+            entity_id = self.queue_entity(entity_type_id, value, source_file)
+        return entity_id
+
+    def queue_entity(self, entity_type_id, value, source_file=None):
+        """Queue a new interned primitive entity for the next flush and return its ID."""
+        entity_id = self.queued_values[entity_type_id, value] = self.generate_id()
+        stored = (1 if value else 0) if entity_type_id == 3 else value
+        self._queue(self.upsert_statements[entity_type_id],
+                    (entity_id, entity_type_id, stored, self.source_file_id(source_file)))
+        return entity_id
+
+    def create_entity(self, entity_type_id, value=None, source_file=None):
+        """Create a new entity with the given type and value."""
+        # Primitive values are interned: an equal one already there is returned instead
+        if entity_type_id in self.VALUE_COLUMNS:
+            return self.intern_entity(entity_type_id, value, source_file)
+
+        entity_id = self.generate_id()
+        source_file_id = self.source_file_id(source_file)
+
+        # Packed arrays store their length and bytes, large ones as an offset into the sidecar
+        if entity_type_id in ARRAY_TYPE_NAMES:
+            store = self.array_store
+            if self.value_column:
+                payload = value.data
+                if store is not None and len(payload) >= store.min_bytes:
+                    payload = store.append(payload)
+                self._queue(
+                    "INSERT INTO EntityData (ID, TYPE_ID, ELEMENT_COUNT, VALUE, SOURCE_FILE_ID) VALUES (?, ?, ?, ?, ?)",
+                    (entity_id, entity_type_id, value.length, payload, source_file_id)
+                )
+                return entity_id
+            if store is not None and len(value.data) >= store.min_bytes:
+                self._queue(
+                    "INSERT INTO EntityData (ID, TYPE_ID, INTEGER_VALUE, NUMERIC_VALUE, SOURCE_FILE_ID) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (entity_id, entity_type_id, value.length, store.append(value.data), source_file_id)
+                )
+                return entity_id
+            self._queue(
+                "INSERT INTO EntityData (ID, TYPE_ID, INTEGER_VALUE, BLOB_VALUE, SOURCE_FILE_ID) VALUES (?, ?, ?, ?, ?)",
+                (entity_id, entity_type_id, value.length, value.data, source_file_id)
+            )
+            return entity_id
+
+        # For complex types (objects and arrays), just store the type
+        if entity_type_id >= 7:
+            self._queue(
+                "INSERT INTO EntityData (ID, TYPE_ID, SOURCE_FILE_ID) VALUES (?, ?, ?)",
+                (entity_id, entity_type_id, source_file_id)
+            )
+            return entity_id
+
+        return None
+
+    def create_relationship(self, source_id, property_id, target_id, relationship_type="HAS_PROPERTY", ordinal=None,
+                            target_value=None, owner_id=None):
+        """Queue a relationship between entities; it is written on the next flush.
+
+        Array elements pass their position as ordinal, with no property_id.
+        An inline scalar target is passed as target_value, with no target_id.
+        An edge from an interned value passes the object or array it was
+        written for as owner_id, so it is deleted along with that.
+        """
+        relationship_type_id = self.relationship_type_ids.get(relationship_type)
+        if relationship_type_id is None:
+            relationship_type_id = self.relationship_type_id(relationship_type)
+        if self.clustered:
+            relationship_id = self.relationship_ids.next()
+            self._queue(
+                "INSERT INTO RelationshipClustered (SOURCE_ID, PROPERTY_ID, ORDINAL, ID, TARGET_ID, "
+                "RELATIONSHIP_TYPE_ID, TARGET_VALUE, OWNER_ID) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source_id, property_id or 0, ordinal or 0, relationship_id, target_id, relationship_type_id,
+                 target_value, owner_id)
+            )
+            return
+        self._queue(
+            "INSERT INTO RelationshipData (SOURCE_ID, PROPERTY_ID, TARGET_ID, RELATIONSHIP_TYPE_ID, ORDINAL, "
+            "TARGET_VALUE, OWNER_ID) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (source_id, property_id, target_id, relationship_type_id, ordinal, target_value, owner_id)
+        )
+
+    def create_value_relationship(self, source_id, property_id, value, source_file=None,
+                                  relationship_type="HAS_PROPERTY", ordinal=None):
+        """Queue a relationship to a primitive value: inline on the edge if its type is inlined, else interned."""
+        if type(value) in self.inline_classes:
+            self.create_relationship(source_id, property_id, None, relationship_type, ordinal, value)
+            return
+        self.create_relationship(source_id, property_id, self.get_or_create_entity(value, source_file),
+                                 relationship_type, ordinal)
+
+    def get_or_create_entity(self, value, source_file=None):
+        """Get an existing entity or create a new one if it doesn't exist."""
+        entity_type_id = self.get_entity_type_id(value)
+
+        # Complex types and NULL are never shared
+        if entity_type_id > 6:
+            return self.create_entity(entity_type_id, value, source_file)
+        return self.intern_entity(entity_type_id, value, source_file)
+
+    def intern_entity(self, entity_type_id, value, source_file=None):
+        """The ID of the primitive entity equal to value, queueing a new one if there is none."""
+        # Answer from the intern cache before asking SQLite
+        key = (entity_type_id, value)
+        entity_id = self.intern_cache.get(key)
+        if entity_id is not None:
+            return entity_id
+
+        # Queued but not yet written, and evicted from the cache since
+        entity_id = self.queued_values.get(key)
+        if entity_id is not None:
+            self.intern_cache.put(key, entity_id)
+            return entity_id
+
+        bloom = self.bloom_filter
+        if bloom is not None and bloom.add_if_new(key):
+            # Never interned here: no lookup
+            entity_id = self.queue_entity(entity_type_id, value, source_file)
+            self.intern_cache.put(key, entity_id)
+            return entity_id
+
+        issued = self.entity_ids.issued
+        entity_id = self.upsert_entity(entity_type_id, value, source_file)
+        if bloom is not None and self.entity_ids.issued != issued:
+            bloom.false_positives += 1
+            bloom.add(key)
+        self.intern_cache.put(key, entity_id)
+        return entity_id
+
+    def delete_source(self, file_path):
+        """Delete the objects, arrays and nulls ingested from file_path, with their relationships.
+
+        That includes the edges between interned values written for them
+        (insertscalarrel.py's name-to-value edges, insertjson.py's element
+        self-edges), found by their OWNER_ID.  Interned values are shared
+        between files; those no other relationship refers to are deleted
+        too, so the database ends up as a full rebuild would leave it.
+        """
+        self.flush()
+        self.cursor.execute('CREATE TEMP TABLE IF NOT EXISTS ReleasedValue ("ID" INTEGER PRIMARY KEY)')
+        source_file_id = self.source_file_id(file_path)
+        if self.cursor.execute("SELECT EXISTS (SELECT 1 FROM SubtreeHash)").fetchone()[0]:
+            # Shared subtrees carry the SOURCE_FILE of whichever file wrote them first
+            recorded = self.manifest.get(file_path)
+            if recorded is not None:
+                self._release(recorded[0])
+            # Containers a run that stopped partway wrote before their parents
+            parentless = self.cursor.execute(
+                "SELECT ID FROM EntityData e WHERE SOURCE_FILE_ID = ? AND TYPE_ID >= 7 "
+                f"AND NOT EXISTS (SELECT 1 FROM {self.relationship_table} WHERE TARGET_ID = e.ID)",
+                (source_file_id,)
+            ).fetchall()
+            for (entity_id,) in parentless:
+                self._release(entity_id)
+        else:
+            owned = "SELECT ID FROM EntityData WHERE SOURCE_FILE_ID = ? AND TYPE_ID >= 7"
+            for column in ("SOURCE_ID", "TARGET_ID", "OWNER_ID"):
+                self._delete_relationships(f"{column} IN ({owned})", (source_file_id,))
+            self.cursor.execute("DELETE FROM EntityData WHERE SOURCE_FILE_ID = ? AND TYPE_ID >= 7", (source_file_id,))
+        self._delete_unreferenced()
+        self.manifest.remove(file_path)
+
+    def _delete_relationships(self, condition, parameters):
+        """Delete the relationships matching condition, noting the entities they referred to in ReleasedValue."""
+        relationships = self.relationship_table
+        for column in ("SOURCE_ID", "PROPERTY_ID", "TARGET_ID"):
+            self.cursor.execute(
+                f"INSERT OR IGNORE INTO temp.ReleasedValue (ID) SELECT {column} FROM {relationships} "
+                f"WHERE {condition} AND {column} IS NOT NULL",
+                parameters
+            )
+        self.cursor.execute(f"DELETE FROM {relationships} WHERE {condition}", parameters)
+
+    def _delete_unreferenced(self):
+        """Delete the interned values in ReleasedValue that no relationship refers to any more."""
+        cursor = self.cursor
+        relationships = self.relationship_table
+        # The clustered table's PROPERTY_ID index is on this expression.  Unary + drops
+        # e.ID's affinity, which would otherwise apply to the expression and rule it out.
+        property_id = "NULLIF(PROPERTY_ID, 0) = +e.ID" if self.clustered else "PROPERTY_ID = e.ID"
+        # CROSS JOIN keeps the few released IDs as the outer loop
+        unreferenced = cursor.execute(
+            f"SELECT e.ID, e.TYPE_ID, {'e.VALUE' if self.value_column else _value_of('e.')} "
+            "FROM temp.ReleasedValue v CROSS JOIN EntityData e ON e.ID = v.ID WHERE e.TYPE_ID <= 6 "
+            f"AND NOT EXISTS (SELECT 1 FROM {relationships} WHERE SOURCE_ID = e.ID) "
+            f"AND NOT EXISTS (SELECT 1 FROM {relationships} WHERE {property_id}) "
+            f"AND NOT EXISTS (SELECT 1 FROM {relationships} WHERE TARGET_ID = e.ID)"
+        ).fetchall()
+        cursor.executemany("DELETE FROM EntityData WHERE ID = ?", [(entity_id,) for entity_id, _, _ in unreferenced])
+        cursor.execute("DELETE FROM temp.ReleasedValue")
+        # A Bloom filter may still hold them, which only costs a lookup
+        for _, entity_type_id, value in unreferenced:
+            self.intern_cache.discard((entity_type_id, bool(value) if entity_type_id == 3 else value))
+
+    def _release(self, root_id):
+        """Delete the tree under root_id, down to the shared subtrees still referenced elsewhere."""
+        cursor = self.cursor
+        relationships = self.relationship_table
+        has_value = self.relationship_type_id("HAS_VALUE")
+        work = [root_id]
+        while work:
+            entity_id = work.pop()
+            children = cursor.execute(
+                f"SELECT r.PROPERTY_ID, r.TARGET_ID, s.ENTITY_ID FROM {relationships} r "
+                "JOIN EntityData e ON e.ID = r.TARGET_ID LEFT JOIN SubtreeHash s ON s.ENTITY_ID = r.TARGET_ID "
+                "WHERE r.SOURCE_ID = ? AND e.TYPE_ID >= 7",
+                (entity_id,)
+            ).fetchall()
+            for prop_entity_id, child_id, shared in children:
+                if shared is None:
+                    work.append(child_id)
+                    continue
+                # One reference fewer, including insertscalarrel.py's name-to-value edge for it
+                self._delete_relationships(
+                    f"SOURCE_ID = ? AND ID = (SELECT ID FROM {relationships} "
+                    "WHERE SOURCE_ID = ? AND TARGET_ID = ? AND RELATIONSHIP_TYPE_ID = ? LIMIT 1)",
+                    (prop_entity_id, prop_entity_id, child_id, has_value)
+                )
+                cursor.execute("UPDATE SubtreeHash SET REFCOUNT = REFCOUNT - 1 WHERE ENTITY_ID = ?", (child_id,))
+                refcount = cursor.execute("SELECT REFCOUNT FROM SubtreeHash WHERE ENTITY_ID = ?", (child_id,)).fetchone()[0]
+                if refcount <= 0:
+                    work.append(child_id)
+            for column in ("SOURCE_ID", "TARGET_ID", "OWNER_ID"):
+                self._delete_relationships(f"{column} = ?", (entity_id,))
+            cursor.execute("DELETE FROM SubtreeHash WHERE ENTITY_ID = ?", (entity_id,))
+            cursor.execute("DELETE FROM EntityData WHERE ID = ?", (entity_id,))
+        # Hashes of deleted subtrees may be cached
+        self.subtree_cache = InternCache(self.subtree_cache.max_bytes)
+
+    def process_object(self, obj, parent_id, source_file=None):
+        """Process a decoded JSON document into entities and relationships, without recursion."""
+        self.process_events(iter_tree_events(obj), parent_id, source_file)
+
+    def process_events(self, events, parent_id, source_file=None):
+        """Process a jsonstream event stream, handing each member to the visitor.
+
+        Open containers live on an explicit stack, so memory is bounded by
+        nesting depth and deep hierarchies never hit the recursion limit.
+        """
+        if self.pack_min_length:
+            events = pack_arrays(events, self.pack_min_length)
+        if self.dedup:
+            self._process_events_dedup(events, parent_id, source_file)
+            return
+        visitor = self.visitor
+        # One frame per open container: [entity ID, is array, next index, member name, leave token]
+        stack = []
+        for event, value in events:
+            if event == "key":
+                stack[-1][3] = value
+                continue
+            if event == "end_object" or event == "end_array":
+                frame = stack.pop()
+                if frame[4] is not None:
+                    visitor.leave(frame[4])
+                continue
+            is_array = event == "start_array"
+            is_container = is_array or event == "start_object"
+            if not stack:
+                # The document itself: its members hang directly off parent_id
+                if is_container:
+                    stack.append([parent_id, is_array, 0, None, None])
+                else:
+                    visitor.document_scalar(parent_id, value, source_file)
+                continue
+
+            frame = stack[-1]
+            if frame[1]:
+                slot = frame[2]
+                frame[2] += 1
+            else:
+                slot = frame[3]
+            if is_container:
+                entity_id, token = visitor.enter(frame[0], slot, frame[1], 8 if is_array else 7, source_file)
+                stack.append([entity_id, is_array, 0, None, token])
+            else:
+                visitor.scalar(frame[0], slot, frame[1], value, source_file)
+
+    def _process_events_dedup(self, events, parent_id, source_file=None):
+        """process_events with equal objects and arrays stored once.
+
+        A container is written when it closes rather than when it opens:
+        its members are held on its stack frame, together with a hash of
+        their content, with nested containers represented by their own
+        hashes.  A container whose hash is already in SubtreeHash is not
+        written again; its parent links to the stored entity instead, so
+        the stored tree becomes a DAG.  Writers ingesting at the same time
+        can each store a subtree the other has not committed yet; the
+        second copy is owned by its file like any unshared container.
+        """
+        visitor = self.visitor
+        # One frame per open container: [entity type, members, content hash, next index or None, member name]
+        stack = []
+        for event, value in events:
+            if event == "key":
+                stack[-1][4] = value
+                continue
+            if event == "start_object" or event == "start_array":
+                is_array = event == "start_array"
+                content_hash = hashlib.sha256(self.hash_seed)
+                content_hash.update(b"[" if is_array else b"{")
+                stack.append([8 if is_array else 7, [], content_hash, 0 if is_array else None, None])
+                continue
+            if event == "scalar":
+                if not stack:
+                    visitor.document_scalar(parent_id, value, source_file)
+                    continue
+                member = (False, value)
+                token = repr((self.get_entity_type_id(value), value))
+            else:
+                entity_type_id, members, content_hash = stack.pop()[:3]
+                if not stack:
+                    # The document itself: its members hang directly off parent_id
+                    self._write_members(parent_id, members, source_file)
+                    continue
+                digest = content_hash.digest()
+                entity_id = self._find_subtree(entity_type_id, digest)
+                if entity_id is None:
+                    entity_id = self.create_entity(entity_type_id, source_file=source_file)
+                    self._write_members(entity_id, members, source_file)
+                    self.subtree_cache.put((entity_type_id, digest), entity_id)
+                    self._queue("INSERT OR IGNORE INTO SubtreeHash (ENTITY_ID, HASH) VALUES (?, ?)", (entity_id, digest))
+                member = (True, entity_id)
+                token = digest.hex()
+
+            frame = stack[-1]
+            if frame[3] is not None:
+                slot = frame[3]
+                frame[3] += 1
+            else:
+                slot = frame[4]
+            frame[1].append((slot, frame[3] is not None) + member)
+            frame[2].update(f"{slot!r}:{token};".encode())
+
+    def _find_subtree(self, entity_type_id, digest):
+        """The entity already stored for a subtree hash, or None."""
+        entity_id = self.subtree_cache.get((entity_type_id, digest))
+        if entity_id is None:
+            row = self.cursor.execute("SELECT ENTITY_ID FROM SubtreeHash WHERE HASH = ?", (digest,)).fetchone()
+            if row is not None:
+                entity_id = row[0]
+                self.subtree_cache.put((entity_type_id, digest), entity_id)
+        return entity_id
+
+    def _write_members(self, entity_id, members, source_file):
+        """Write the rows for a container's members, held back until it closed."""
+        visitor = self.visitor
+        for slot, is_index, is_container, value in members:
+            if is_container:
+                visitor.link(entity_id, slot, is_index, value, source_file)
+                self.refcount_deltas[value] += 1
+            else:
+                visitor.scalar(entity_id, slot, is_index, value, source_file)
+
+def find_files(directory, file_pattern):
+    """Find files matching the pattern in the given directory."""
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file_pattern in file:
+                yield os.path.join(root, file)
+
+# Event names by the small integer code used in flattened batches
+EVENT_NAMES = ("start_object", "end_object", "start_array", "end_array", "key", "scalar")
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_NAMES)}
+
+def flatten_file(file_path, stream=False):
+    """Parse one file into a compact event batch for the writer; runs in a worker process.
+
+    Returns (file_path, codes, values): codes is one byte per event and
+    values holds the payload of each key and scalar event in order.  On
+    failure codes is None and values is the error message.
+    """
+    codes = bytearray()
+    values = []
+    key_code = EVENT_CODES["key"]
+    try:
+        if stream:
+            with open(file_path, 'rb') as f:
+                for event, value in iter_events(f):
+                    code = EVENT_CODES[event]
+                    codes.append(code)
+                    if code >= key_code:
+                        values.append(value)
+        else:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+            for event, value in iter_tree_events(data):
+                code = EVENT_CODES[event]
+                codes.append(code)
+                if code >= key_code:
+                    values.append(value)
+    except json.JSONDecodeError:
+        return file_path, None, f"JSON decoding error in file: {file_path}"
+    except IOError as e:
+        return file_path, None, f"IO error processing file {file_path}: {e}"
+    return file_path, bytes(codes), values
+
+def iter_flat_events(codes, values):
+    """Expand a flatten_file batch back into jsonstream events."""
+    values = iter(values)
+    key_code = EVENT_CODES["key"]
+    for code in codes:
+        yield EVENT_NAMES[code], (next(values) if code >= key_code else None)
+
+def flatten_files(file_paths, workers, stream=False):
+    """Flatten files in a process pool, yielding batches in input order.
+
+    At most two batches per worker are in flight, so a slow writer holds
+    back the readers instead of piling parsed files up in memory.  Results
+    come back in input order, so IDs match a serial run.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for file_path in file_paths:
+            pending.append(pool.submit(flatten_file, file_path, stream))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def main(visitor_class=PropertyVisitor, file_patterns=("cgeball.json",),
+         search_dir="~/X3DJSONLD/src/main/personal/"):
+    parser = argparse.ArgumentParser(description="Load X3D JSON files into EntityRelationship.sqlite3")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse files incrementally instead of with json.load, for very large scenes")
+    parser.add_argument("--workers", type=int, default=0, metavar="N",
+                        help="parse files in N worker processes; this process stays the only writer")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep the existing database and only re-ingest files that changed")
+    parser.add_argument("--clustered", action="store_true",
+                        help="store relationships clustered by source entity behind a Relationship view; "
+                             "--incremental keeps the existing database's layout")
+    parser.add_argument("--value-column", action="store_true",
+                        help="store each scalar in one dynamically typed VALUE column; "
+                             "with --incremental an existing database is converted in place")
+    parser.add_argument("--inline-scalars", metavar="TYPES",
+                        help="store scalars of these comma-separated types (INTEGER, TEXT, BLOB, REAL) on their "
+                             "edges instead of interning them, e.g. REAL for geometry; insert.py and "
+                             "insertscalarrel.py only")
+    parser.add_argument("--bulk", action="store_true",
+                        help="initial-load mode: relaxed durability, indexes rebuilt once at the end; "
+                             "not with --incremental")
+    parser.add_argument("--dedup", action="store_true",
+                        help="store identical objects and arrays once and share them between parents")
+    parser.add_argument("--pack-arrays", type=int, default=0, metavar="MIN_LENGTH",
+                        help="store numeric arrays of at least MIN_LENGTH elements as one packed BLOB")
+    parser.add_argument("--array-store", type=int, default=0, metavar="MIN_BYTES",
+                        help="with --pack-arrays, keep payloads of at least MIN_BYTES in a memory-mappable "
+                             "file next to the database")
+    parser.add_argument("--bloom-bytes", type=int, default=0, metavar="BYTES",
+                        help="keep a BYTES-sized Bloom filter of interned values so values never seen before skip "
+                             "the database lookup; pays off when most scalars are new, as in geometry")
+    parser.add_argument("--bloom-error-rate", type=float, default=0.01, metavar="RATE",
+                        help="target false positive rate of the --bloom-bytes filter (default 0.01)")
+    parser.add_argument("--stats", metavar="PATH",
+                        help="write a JSON summary of phase timings, interning and row counts to PATH (- for stdout)")
+    parser.add_argument("--progress", type=float, metavar="SECONDS",
+                        help="log a progress line every SECONDS")
+    args = parser.parse_args()
+    if args.array_store and not args.pack_arrays:
+        parser.error("--array-store needs --pack-arrays")
+    if args.bulk and args.incremental:
+        # Re-ingesting a changed file deletes its rows through the indexes --bulk drops
+        parser.error("--bulk is for initial loads and cannot be combined with --incremental")
+    if not 0 < args.bloom_error_rate < 1:
+        parser.error("--bloom-error-rate must be between 0 and 1")
+    inline_types = []
+    for name in (args.inline_scalars or "").split(","):
+        if not name.strip():
+            continue
+        if name.strip().upper() not in INLINE_TYPES:
+            parser.error(f"--inline-scalars: {name} is not one of {', '.join(INLINE_TYPES)}")
+        inline_types.append(INLINE_TYPES[name.strip().upper()])
+
+    # Directory to search
+    search_dir = os.path.expanduser(search_dir)
+
+    # Create the database
+    connection = create_database(reset=not args.incremental, clustered=args.clustered,
+                                 value_column=args.value_column)
+
+    # Large packed arrays go to the sidecar file; a full rebuild starts it afresh
+    array_store = None
+    if args.array_store:
+        db_path = connection.execute("PRAGMA database_list").fetchone()[2]
+        array_store = ArrayStore(sidecar_path(db_path), "a" if args.incremental else "w", args.array_store)
+
+    # Timers and counters, only when asked for
+    stats = IngestStats(args.progress) if args.stats or args.progress else None
+
+    def phase(name):
+        return stats.phase(name) if stats else nullcontext()
+
+    # Create entity manager
+    entity_manager = EntityManager(connection, visitor_class=visitor_class, stats=stats, dedup=args.dedup,
+                                   pack_min_length=args.pack_arrays, array_store=array_store,
+                                   inline_types=inline_types, bloom_bytes=args.bloom_bytes,
+                                   bloom_error_rate=args.bloom_error_rate)
+    manifest = entity_manager.manifest
+
+    # Every matching file for each pattern
+    file_paths = (file_path for file_pattern in file_patterns
+                  for file_path in find_files(search_dir, file_pattern))
+
+    # Fingerprints of the files that are new or changed since the last run
+    fingerprints = {}
+
+    def changed_files():
+        for file_path in file_paths:
+            fingerprint = manifest.check(file_path)
+            if fingerprint is None:
+                logger.info(f"Unchanged, skipping: {file_path}")
+                continue
+            fingerprints[file_path] = fingerprint
+            yield file_path
+
+    def begin_file(file_path):
+        logger.info(f"Processing file: {file_path}")
+        if stats:
+            stats.begin_file(file_path)
+        if manifest.get(file_path) is not None:
+            entity_manager.delete_source(file_path)
+        root_entity_id = entity_manager.visitor.begin_file(file_path)
+        # Rows commit batch by batch, so the file is recorded as changed
+        # until it is done; a run that stops partway re-ingests it
+        manifest.record(file_path, UNFINISHED, root_entity_id)
+        return root_entity_id
+
+    def end_file(file_path, root_entity_id, error=None):
+        if error:
+            logger.error(error)
+        # The file's rows and its manifest entry commit together, after the payloads they point at
+        if array_store is not None:
+            array_store.sync()
+        manifest.record(file_path, fingerprints.pop(file_path), root_entity_id)
+        entity_manager.flush()
+        if stats:
+            stats.end_file(error)
+
+    # Without --bulk this is a no-op context.  The phases around it charge
+    # its index rebuild and checks on exit to "finish" rather than "walk".
+    with phase("finish"), (bulk_load(connection) if args.bulk else nullcontext()), phase("walk"):
+        if args.incremental:
+            for file_path in manifest.missing():
+                logger.info(f"Removed, deleting: {file_path}")
+                entity_manager.delete_source(file_path)
+
+        if args.workers > 0:
+            flattened = flatten_files(changed_files(), args.workers, args.stream)
+            if stats:
+                # Time spent waiting for the workers
+                flattened = stats.timed_iter("parse", flattened)
+            for file_path, codes, values in flattened:
+                root_entity_id = begin_file(file_path)
+                if codes is None:
+                    end_file(file_path, root_entity_id, values)
+                    continue
+                entity_manager.process_events(iter_flat_events(codes, values), root_entity_id, file_path)
+                end_file(file_path, root_entity_id)
+        else:
+            for file_path in changed_files():
+                # Create a root entity for the file, with its filename
+                root_entity_id = begin_file(file_path)
+
+                # Read and process the JSON file
+                error = None
+                try:
+                    if args.stream:
+                        with open(file_path, 'rb') as f:
+                            events = iter_events(f)
+                            if stats:
+                                events = stats.timed_iter("parse", events)
+                            entity_manager.process_events(events, root_entity_id, file_path)
+                    else:
+                        with open(file_path, 'r') as f:
+                            with phase("parse"):
+                                data = json.load(f)
+                            entity_manager.process_object(data, root_entity_id, file_path)
+                except json.JSONDecodeError:
+                    error = f"JSON decoding error in file: {file_path}"
+                except IOError as e:
+                    error = f"IO error processing file {file_path}: {e}"
+                end_file(file_path, root_entity_id, error)
+
+        entity_manager.flush()
+
+    cache = entity_manager.intern_cache
+    logger.info(f"Intern cache: {cache.hits} hits, {cache.misses} misses, "
+                f"{cache.evictions} evictions, {len(cache)} entries")
+    bloom = entity_manager.bloom_filter
+    if bloom is not None:
+        logger.info(f"Bloom filter: {bloom.negatives} lookups skipped, {bloom.positives} made "
+                    f"({bloom.false_positives} false positives), {len(bloom)} keys in {bloom.max_bytes} bytes, "
+                    f"error rate {bloom.observed_error_rate():.4f} observed, {bloom.estimated_error_rate():.4f} estimated")
+        if len(bloom) > bloom.capacity:
+            logger.warning(f"Bloom filter holds {len(bloom)} keys, over the {bloom.capacity} it was sized for; "
+                           "raise --bloom-bytes")
+
+    # Commit the changes and close the connection, once the payloads they point at are on disk
+    with phase("commit"):
+        if array_store is not None:
+            array_store.close()
+        connection.commit()
+    connection.close()
+
+    if stats:
+        stats.progress(force=True)
+        if args.stats == "-":
+            print(json.dumps(stats.summary(), indent=2))
+        elif args.stats:
+            stats.write(args.stats)
+
+    logger.info("Database creation completed successfully")
+
+if __name__ == "__main__":
+    main()
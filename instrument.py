@@ -0,0 +1,185 @@
+"""Opt-in timers and counters for an ingest run.
+
+IngestStats splits wall and CPU time into phases.  Time is charged to
+exactly one phase at a time: entering a nested phase (a find_entity
+probe inside an intern call) pauses the outer one, so the phases add up
+to the run's total.  Time spent outside every named phase is "walk",
+the traversal and visitor code itself.
+
+EntityManager wraps its hot methods only when given an IngestStats, so
+an uninstrumented run pays nothing for this module.
+"""
+import json
+import time
+import logging
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class IngestStats:
+    def __init__(self, progress_interval=None):
+        self.progress_interval = progress_interval
+        self.wall = defaultdict(float)
+        self.cpu = defaultdict(float)
+        self.calls = Counter()
+        self.counters = Counter()
+        self.rows = Counter()
+        self.files = []
+        self.manager = None
+
+        self.current_phase = "walk"
+        self.started = self._mark = time.perf_counter()
+        self.cpu_started = self._cpu_mark = time.process_time()
+        self._next_progress = self.started + (progress_interval or 0)
+        self._file = None
+
+    def _switch(self, phase):
+        """Charge the time since the last switch to the current phase and enter phase."""
+        now, cpu_now = time.perf_counter(), time.process_time()
+        previous = self.current_phase
+        self.wall[previous] += now - self._mark
+        self.cpu[previous] += cpu_now - self._cpu_mark
+        self._mark, self._cpu_mark = now, cpu_now
+        self.current_phase = phase
+        return previous
+
+    @contextmanager
+    def phase(self, name):
+        previous = self._switch(name)
+        self.calls[name] += 1
+        try:
+            yield
+        finally:
+            self._switch(previous)
+
+    def timed(self, name, function):
+        """Wrap function so its calls are charged to phase name."""
+        def timed_function(*args, **kwargs):
+            previous = self._switch(name)
+            self.calls[name] += 1
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._switch(previous)
+        return timed_function
+
+    def timed_iter(self, name, iterable):
+        """Charge the time spent producing each item of iterable to phase name."""
+        iterator = iter(iterable)
+        while True:
+            previous = self._switch(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._switch(previous)
+            yield item
+
+    def instrument(self, manager):
+        """Replace manager's hot methods, on the instance, with timed and counting wrappers."""
+        self.manager = manager
+        self._first_id = manager.entity_ids.issued
+
+        manager.get_or_create_entity = self.timed("intern", manager.get_or_create_entity)
+        manager.find_entity = self.timed("lookup", manager.find_entity)
+        manager.create_entity = self.timed("insert", manager.create_entity)
+        manager.flush = self.timed("insert", manager.flush)
+        manager.delete_source = self.timed("delete", manager.delete_source)
+
+        upsert_entity = self.timed("insert", manager.upsert_entity)
+        def counted_upsert(*args, **kwargs):
+            issued = manager.entity_ids.issued
+            entity_id = upsert_entity(*args, **kwargs)
+            self.counters["intern_inserted" if manager.entity_ids.issued != issued else "intern_found"] += 1
+            return entity_id
+        manager.upsert_entity = counted_upsert
+
+        create_relationship = manager.create_relationship
+        def counted_relationship(*args, **kwargs):
+            self.rows["Relationship"] += 1
+            return create_relationship(*args, **kwargs)
+        manager.create_relationship = counted_relationship
+
+        # flush runs once per batch, so big files still report progress
+        if self.progress_interval:
+            flush = manager.flush
+            def flush_with_progress():
+                flush()
+                self.progress()
+            manager.flush = flush_with_progress
+
+    def entity_rows(self):
+        # Every Entity row takes the next ID, so the IDs handed out are the row count
+        return self.manager.entity_ids.issued - self._first_id if self.manager else 0
+
+    def begin_file(self, file_path):
+        self._file = (file_path, time.perf_counter(), self.entity_rows(), self.rows["Relationship"])
+
+    def end_file(self, error=None):
+        file_path, started, entities, relationships = self._file
+        self._file = None
+        record = {
+            "path": file_path,
+            "seconds": round(time.perf_counter() - started, 4),
+            "rows": {
+                "Entity": self.entity_rows() - entities,
+                "Relationship": self.rows["Relationship"] - relationships,
+            },
+        }
+        if error:
+            record["error"] = error
+        self.files.append(record)
+        self.progress()
+
+    def progress(self, force=False):
+        """Log a progress line if the interval has passed."""
+        if not self.progress_interval:
+            return
+        now = time.perf_counter()
+        if now < self._next_progress and not force:
+            return
+        self._next_progress = now + self.progress_interval
+        elapsed = now - self.started
+        rows = self.entity_rows() + self.rows["Relationship"]
+        logger.info(f"Progress: {len(self.files)} files, {rows} rows, "
+                    f"{rows / elapsed if elapsed else 0:.0f} rows/s, {elapsed:.1f} s")
+
+    def summary(self):
+        self._switch(self.current_phase)
+        wall = time.perf_counter() - self.started
+        cpu = time.process_time() - self.cpu_started
+        rows = dict(self.rows, Entity=self.entity_rows())
+        interning = dict(self.counters)
+        if self.manager is not None:
+            cache = self.manager.intern_cache
+            interning.update(cache_hits=cache.hits, cache_misses=cache.misses,
+                             cache_evictions=cache.evictions, cache_entries=len(cache))
+            bloom = self.manager.bloom_filter
+            if bloom is not None:
+                interning.update(bloom_skipped=bloom.negatives, bloom_lookups=bloom.positives,
+                                 bloom_false_positives=bloom.false_positives, bloom_keys=len(bloom),
+                                 bloom_bytes=bloom.max_bytes, bloom_hash_count=bloom.hash_count,
+                                 bloom_capacity=bloom.capacity,
+                                 bloom_observed_error_rate=round(bloom.observed_error_rate(), 6),
+                                 bloom_estimated_error_rate=round(bloom.estimated_error_rate(), 6))
+        return {
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "rows_per_second": round(sum(rows.values()) / wall, 1) if wall else None,
+            "phases": {
+                name: {"wall_seconds": round(self.wall[name], 4),
+                       "cpu_seconds": round(self.cpu[name], 4),
+                       "calls": self.calls[name]}
+                for name in sorted(self.wall, key=self.wall.get, reverse=True)
+            },
+            "interning": interning,
+            "rows": rows,
+            "files": self.files,
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+            f.write("\n")
@@ -0,0 +1,190 @@
+"""Incremental JSON tokenizer for documents too large to json.load.
+
+iter_events(f) reads f in chunks and yields (event, value) pairs:
+
+    ("start_object", None)   ("key", name)          ("end_object", None)
+    ("start_array", None)    ("scalar", value)      ("end_array", None)
+
+Scalars decode exactly as json.load decodes them.  Only the current chunk
+and the stack of open containers are held in memory, so a consumer that
+keeps one frame per open container runs in memory bounded by nesting depth.
+"""
+import codecs
+import json
+import re
+from json.decoder import scanstring
+
+CHUNK_SIZE = 1 << 16
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+NUMBER_CHARS = re.compile(r'[-+0-9.eE]*')
+
+# json.load also accepts the non-standard NaN and Infinity constants
+LITERALS = {
+    'true': True,
+    'false': False,
+    'null': None,
+    'NaN': float('nan'),
+    'Infinity': float('inf'),
+    '-Infinity': float('-inf'),
+}
+LONGEST_LITERAL = max(len(literal) for literal in LITERALS)
+
+# Parser states: what the grammar allows next
+VALUE, KEY, COLON, AFTER = range(4)
+
+class Tokenizer:
+    """Pull-parser over a text or binary file object."""
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = None
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        """Append the next chunk to the buffer, dropping text already consumed."""
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.chunk_size)
+        at_end = not chunk
+        if isinstance(chunk, bytes):
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+            # May be empty mid-file while a multi-byte character is split across reads
+            chunk = self.decoder.decode(chunk, final=at_end)
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        if chunk:
+            self.buf += chunk
+        self.eof = at_end
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character, or '' at end of input."""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _error(self, message):
+        return json.JSONDecodeError(message, self.buf, self.pos)
+
+    def _string(self):
+        while True:
+            try:
+                value, end = scanstring(self.buf, self.pos + 1)
+            except json.JSONDecodeError:
+                # Possibly cut off at the chunk boundary; grow geometrically and retry
+                if not self._fill(max(self.chunk_size, len(self.buf) - self.pos)):
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def _number(self):
+        # A number cut off at the chunk boundary ("1e", "0.") must be completed first
+        while NUMBER_CHARS.match(self.buf, self.pos).end() == len(self.buf) and self._fill():
+            pass
+        match = NUMBER.match(self.buf, self.pos)
+        if match is None:
+            raise self._error("Expecting value")
+        integer, frac, exp = match.groups()
+        self.pos = match.end()
+        if frac or exp:
+            return float(integer + (frac or '') + (exp or ''))
+        return int(integer)
+
+    def _literal(self):
+        while len(self.buf) - self.pos < LONGEST_LITERAL and self._fill():
+            pass
+        for literal, value in LITERALS.items():
+            if self.buf.startswith(literal, self.pos):
+                self.pos += len(literal)
+                return value
+        raise self._error("Expecting value")
+
+    def events(self):
+        stack = []  # True for an open object, False for an open array
+        state = VALUE
+        first = False  # just opened a container, so it may close immediately
+        while True:
+            c = self._peek()
+            if state == AFTER:
+                if not stack:
+                    if c:
+                        raise self._error("Extra data")
+                    return
+                self.pos += 1
+                if c == ',':
+                    state = KEY if stack[-1] else VALUE
+                elif c == '}' and stack[-1]:
+                    stack.pop()
+                    yield 'end_object', None
+                elif c == ']' and not stack[-1]:
+                    stack.pop()
+                    yield 'end_array', None
+                else:
+                    self.pos -= 1
+                    raise self._error("Expecting ',' delimiter")
+            elif state == KEY:
+                if c == '"':
+                    yield 'key', self._string()
+                    state = COLON
+                elif c == '}' and first:
+                    self.pos += 1
+                    stack.pop()
+                    yield 'end_object', None
+                    state = AFTER
+                else:
+                    raise self._error("Expecting property name enclosed in double quotes")
+                first = False
+            elif state == COLON:
+                if c != ':':
+                    raise self._error("Expecting ':' delimiter")
+                self.pos += 1
+                state = VALUE
+            else:
+                state = AFTER
+                if c == '{':
+                    self.pos += 1
+                    stack.append(True)
+                    yield 'start_object', None
+                    state = KEY
+                    first = True
+                    continue
+                if c == '[':
+                    self.pos += 1
+                    stack.append(False)
+                    yield 'start_array', None
+                    state = VALUE
+                    first = True
+                    continue
+                if c == ']' and first:
+                    self.pos += 1
+                    stack.pop()
+                    yield 'end_array', None
+                elif c == '"':
+                    yield 'scalar', self._string()
+                elif c == '-' or c.isdigit():
+                    while len(self.buf) - self.pos < 2 and self._fill():
+                        pass
+                    if self.buf.startswith('-I', self.pos):
+                        yield 'scalar', self._literal()
+                    else:
+                        yield 'scalar', self._number()
+                elif c:
+                    yield 'scalar', self._literal()
+                else:
+                    raise self._error("Expecting value")
+                first = False
+
+def iter_events(f, chunk_size=CHUNK_SIZE):
+    """Yield (event, value) pairs for the JSON document in file object f."""
+    return Tokenizer(f, chunk_size).events()
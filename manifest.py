@@ -0,0 +1,92 @@
+"""Per-file manifest for incremental ingest.
+
+Each ingested file is recorded with its size, modification time and
+content hash.  On the next run a file whose size and mtime are unchanged
+is skipped without being read; one that was merely touched is hashed and
+skipped if its content is the same.
+"""
+import hashlib
+import os
+
+# Fingerprint of a file that is still being ingested; check() sees it as changed
+UNFINISHED = (-1, -1, "")
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class SourceManifest:
+    """The SourceManifest table of one database.
+
+    ROOT_ID and LAST_ID are what the ingesting script needs to find the
+    rows of a file again: the root entity for insert*.py, the first and
+    last Objects ID for connect.py.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS "SourceManifest" (
+                "SOURCE_FILE" TEXT PRIMARY KEY,
+                "SIZE" INTEGER NOT NULL,
+                "MTIME_NS" INTEGER NOT NULL,
+                "CONTENT_HASH" TEXT NOT NULL,
+                "ROOT_ID" INTEGER,
+                "LAST_ID" INTEGER
+            )
+        ''')
+
+    def get(self, file_path):
+        """Return (ROOT_ID, LAST_ID) recorded for file_path, or None."""
+        return self.connection.execute(
+            'SELECT ROOT_ID, LAST_ID FROM SourceManifest WHERE SOURCE_FILE = ?', (file_path,)
+        ).fetchone()
+
+    def check(self, file_path):
+        """Return None if file_path is unchanged since it was recorded.
+
+        Otherwise return its current fingerprint, to pass to record() once
+        the file has been ingested again.  A file deleted since it was
+        listed is skipped too; missing() reports it for removal.
+        """
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        row = self.connection.execute(
+            'SELECT SIZE, MTIME_NS, CONTENT_HASH FROM SourceManifest WHERE SOURCE_FILE = ?', (file_path,)
+        ).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return None
+        try:
+            content_hash = hash_file(file_path)
+        except FileNotFoundError:
+            return None
+        if row is not None and row[2] == content_hash:
+            # Touched but not modified: remember the new mtime so it is not hashed again
+            self.connection.execute(
+                'UPDATE SourceManifest SET SIZE = ?, MTIME_NS = ? WHERE SOURCE_FILE = ?',
+                (stat.st_size, stat.st_mtime_ns, file_path)
+            )
+            return None
+        return stat.st_size, stat.st_mtime_ns, content_hash
+
+    def record(self, file_path, fingerprint, root_id, last_id=None):
+        size, mtime_ns, content_hash = fingerprint
+        self.connection.execute(
+            'INSERT OR REPLACE INTO SourceManifest (SOURCE_FILE, SIZE, MTIME_NS, CONTENT_HASH, ROOT_ID, LAST_ID) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (file_path, size, mtime_ns, content_hash, root_id, last_id)
+        )
+
+    def remove(self, file_path):
+        self.connection.execute('DELETE FROM SourceManifest WHERE SOURCE_FILE = ?', (file_path,))
+
+    def missing(self):
+        """Recorded files that no longer exist on disk."""
+        paths = [row[0] for row in self.connection.execute('SELECT SOURCE_FILE FROM SourceManifest')]
+        return [path for path in paths if not os.path.exists(path)]
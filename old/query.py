@@ -2,55 +2,63 @@ import sqlite3
 import tkinter as tk
 from tkinter import ttk
 
+# connect.py's SCHEMA_VERSION this was written for
+SCHEMA_VERSION = 2
+
+# Value columns connect.py fills, each indexed by property in ObjectData
+VALUE_COLUMNS = ("RELATED_ID", "INTEGER_VALUE", "TEXT_VALUE", "BOOLEAN_VALUE", "REAL_VALUE")
+
+# The 20 most common values of a property, as (column, value).  Each
+# column is counted on its own index, so only the property's rows are read.
+TOP_VALUES_QUERY = " UNION ALL ".join(
+    f"SELECT '{column}', {column}, COUNT(*) FROM ObjectData "
+    f"WHERE PROPERTY_NAME_ID = ?1 AND {column} IS NOT NULL GROUP BY {column}"
+    for column in VALUE_COLUMNS
+) + " ORDER BY 3 DESC LIMIT 20"
+
 def add_filters():
-    # Fetch distinct property names from the database
-    cursor.execute("SELECT DISTINCT PROPERTY_NAME FROM Objects")
-    property_names = [record[0] for record in cursor.fetchall()]
+    # Fetch the property names that have rows; PropertyName keeps the names of deleted rows
+    cursor.execute("""
+        SELECT ID, NAME FROM PropertyName p
+        WHERE EXISTS (SELECT 1 FROM ObjectData o WHERE o.PROPERTY_NAME_ID = p.ID)
+        ORDER BY ID
+    """)
+    properties = cursor.fetchall()
 
-    # Create a dictionary to store the state of each checkbox for each property name
-    checkbox_vars = {prop: [] for prop in property_names}
+    # Create a dictionary to store the state of each checkbox for each property ID
+    checkbox_vars = {prop_id: [] for prop_id, prop in properties}
 
     # Create checkboxes for each property name and its top 20 unique values
-    for prop in property_names:
+    for prop_id, prop in properties:
         # Create a frame for each property group
         prop_frame = ttk.LabelFrame(checkbox_inner_frame, text=prop)
         prop_frame.pack(fill=tk.X, padx=5, pady=5, anchor=tk.W)
 
-        # Query and create checkboxes for unique values
-        cursor.execute(f"""
-            SELECT RELATED_ID, INTEGER_VALUE, TEXT_VALUE, BOOLEAN_VALUE, BLOB_VALUE, REAL_VALUE, NUMERIC_VALUE
-            FROM Objects
-            WHERE PROPERTY_NAME = ?
-            GROUP BY RELATED_ID, INTEGER_VALUE, TEXT_VALUE, BOOLEAN_VALUE, BLOB_VALUE, REAL_VALUE, NUMERIC_VALUE
-            ORDER BY COUNT(*) DESC
-            LIMIT 20
-        """, (prop,))
-
-        values = cursor.fetchall()
-        unique_values = set()
-
-        for value in values:
-            for val in value:
-                if val is not None and val not in unique_values:
-                    unique_values.add(val)
-                    var = tk.BooleanVar()
-                    checkbox_vars[prop].append((val, var))
-                    checkbox = ttk.Checkbutton(
-                        prop_frame,
-                        text=str(val),
-                        variable=var,
-                        onvalue=True,
-                        offvalue=False
-                    )
-                    checkbox.pack(anchor=tk.W)
+        # Query and create checkboxes for unique values, with the columns each was found in
+        cursor.execute(TOP_VALUES_QUERY, (prop_id,))
+        unique_values = {}
+        for column, val, count in cursor.fetchall():
+            unique_values.setdefault(val, []).append(column)
+
+        for val, columns in unique_values.items():
+            var = tk.BooleanVar()
+            checkbox_vars[prop_id].append((val, columns, var))
+            checkbox = ttk.Checkbutton(
+                prop_frame,
+                text=str(val),
+                variable=var,
+                onvalue=True,
+                offvalue=False
+            )
+            checkbox.pack(anchor=tk.W)
 
     # Function to execute the query based on selected properties
     def execute_query():
         selected_values = []
-        for prop, vals in checkbox_vars.items():
-            for val, var in vals:
+        for prop_id, vals in checkbox_vars.items():
+            for val, columns, var in vals:
                 if var.get():
-                    selected_values.append((prop, val))
+                    selected_values.extend((prop_id, column, val) for column in columns)
         if not selected_values:
             # Clear previous results
             for row in tree.get_children():
@@ -58,10 +66,11 @@ def add_filters():
             tree.insert("", "end", values=("No properties selected.", "", ""))
             return
 
-        query = f"SELECT ID, PROPERTY_NAME, RELATED_ID, INTEGER_VALUE, TEXT_VALUE, BOOLEAN_VALUE, BLOB_VALUE, REAL_VALUE, NUMERIC_VALUE FROM Objects WHERE {' OR '.join([f'(PROPERTY_NAME = ? AND (RELATED_ID = ? OR INTEGER_VALUE = ? OR TEXT_VALUE = ? OR BOOLEAN_VALUE = ? OR BLOB_VALUE = ? OR REAL_VALUE = ? OR NUMERIC_VALUE = ?))' for _ in selected_values])}"
+        # One (property, column) index lookup per selected value
+        query = f"SELECT o.ID, p.NAME, o.RELATED_ID, o.INTEGER_VALUE, o.TEXT_VALUE, o.BOOLEAN_VALUE, o.BLOB_VALUE, o.REAL_VALUE, o.NUMERIC_VALUE FROM ObjectData o JOIN PropertyName p ON p.ID = o.PROPERTY_NAME_ID WHERE {' OR '.join([f'(o.PROPERTY_NAME_ID = ? AND o.{column} = ?)' for _, column, _ in selected_values])}"
         params = []
-        for prop, val in selected_values:
-            params.extend([prop, val, val, val, val, val, val, val])
+        for prop_id, column, val in selected_values:
+            params.extend([prop_id, val])
         cursor.execute(query, tuple(params))
         results = cursor.fetchall()
 
@@ -83,6 +92,8 @@ def add_filters():
 # Connect to the database
 connection = sqlite3.connect("ThreeDimAssets.sqlite3")
 cursor = connection.cursor()
+if cursor.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+    raise SystemExit("ThreeDimAssets.sqlite3 is from an older connect.py; run connect.py --incremental to upgrade it")
 
 # Create the main application window
 root = tk.Tk()
@@ -0,0 +1,199 @@
+"""Packed storage for homogeneous numeric JSON arrays.
+
+X3D geometry is mostly long numeric arrays (@point, @coordIndex, @key,
+@keyValue, ...).  Stored element by element, each number costs a
+Relationship row and an index entity.  pack_arrays() instead collapses
+such an array into a single PackedArray value, stored as one Entity:
+
+    TYPE_ID        INT32_ARRAY, INT64_ARRAY or FLOAT64_ARRAY
+    INTEGER_VALUE  number of elements
+    BLOB_VALUE     the elements, little-endian
+
+An array of ints and floats packs as FLOAT64_ARRAY, so its ints read back
+as floats.  read_array() returns an array.array built straight from the
+blob, or with as_numpy=True a NumPy array viewing the blob's bytes; neither
+creates a Python object per element.  Large payloads can live in an
+arraystore.ArrayStore sidecar file instead of BLOB_VALUE.
+"""
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Entity types, continuing the EntityType table
+INT32_ARRAY = 10
+INT64_ARRAY = 11
+FLOAT64_ARRAY = 12
+
+ARRAY_TYPE_NAMES = {
+    INT32_ARRAY: "INT32_ARRAY",
+    INT64_ARRAY: "INT64_ARRAY",
+    FLOAT64_ARRAY: "FLOAT64_ARRAY",
+}
+
+def _typecode(candidates, itemsize):
+    return next(code for code in candidates if array(code).itemsize == itemsize)
+
+# array module typecode and NumPy dtype for each entity type
+TYPECODES = {
+    INT32_ARRAY: _typecode("il", 4),
+    INT64_ARRAY: "q",
+    FLOAT64_ARRAY: "d",
+}
+DTYPES = {
+    INT32_ARRAY: "<i4",
+    INT64_ARRAY: "<i8",
+    FLOAT64_ARRAY: "<f8",
+}
+DTYPE_SIZES = {
+    INT32_ARRAY: 4,
+    INT64_ARRAY: 8,
+    FLOAT64_ARRAY: 8,
+}
+
+# Largest int a float64 holds exactly
+MAX_EXACT_FLOAT_INT = 2 ** 53
+
+BIG_ENDIAN = sys.byteorder == "big"
+
+class PackedArray:
+    """A numeric JSON array packed into little-endian bytes."""
+
+    __slots__ = ("entity_type_id", "length", "data")
+
+    def __init__(self, entity_type_id, length, data):
+        self.entity_type_id = entity_type_id
+        self.length = length
+        self.data = data
+
+    def __repr__(self):
+        return f"PackedArray({ARRAY_TYPE_NAMES[self.entity_type_id]}, {self.length}, {self.data.hex()})"
+
+    def __eq__(self, other):
+        return (isinstance(other, PackedArray) and self.entity_type_id == other.entity_type_id
+                and self.data == other.data)
+
+    def __hash__(self):
+        return hash((self.entity_type_id, self.data))
+
+    @classmethod
+    def pack(cls, values):
+        """Pack a list of ints and floats, or return None if it does not fit one element type."""
+        kinds = set(map(type, values))
+        if kinds == {int}:
+            low, high = min(values), max(values)
+            if -2 ** 31 <= low and high < 2 ** 31:
+                entity_type_id = INT32_ARRAY
+            elif -2 ** 63 <= low and high < 2 ** 63:
+                entity_type_id = INT64_ARRAY
+            else:
+                return None
+        elif kinds == {float} or kinds == {int, float}:
+            if int in kinds and any(type(v) is int and abs(v) > MAX_EXACT_FLOAT_INT for v in values):
+                return None
+            entity_type_id = FLOAT64_ARRAY
+        else:
+            return None
+        packed = array(TYPECODES[entity_type_id], values)
+        if BIG_ENDIAN:
+            packed.byteswap()
+        return cls(entity_type_id, len(packed), packed.tobytes())
+
+    def to_array(self):
+        return unpack(self.entity_type_id, self.data)
+
+def pack_arrays(events, min_length=2):
+    """Filter a jsonstream event stream, replacing numeric arrays with PackedArray scalars.
+
+    The document itself is never packed, only arrays nested in it.  Only
+    the innermost open array is held back while it might still pack, so
+    memory stays bounded by the longest array.
+    """
+    depth = 0
+    pending = None  # elements of the open array, while it holds nothing but numbers
+    for event, value in events:
+        if pending is not None:
+            if event == "scalar" and (type(value) is int or type(value) is float):
+                pending.append(value)
+                continue
+            if event == "end_array":
+                packed = PackedArray.pack(pending) if len(pending) >= min_length else None
+                if packed is not None:
+                    yield "scalar", packed
+                else:
+                    yield "start_array", None
+                    for element in pending:
+                        yield "scalar", element
+                    yield "end_array", None
+                pending = None
+                continue
+            # Something other than a number: replay the array so far and pass the event on
+            yield "start_array", None
+            for element in pending:
+                yield "scalar", element
+            depth += 1
+            pending = None
+        if event == "start_array" and depth:
+            pending = []
+            continue
+        if event == "start_object" or event == "start_array":
+            depth += 1
+        elif event == "end_object" or event == "end_array":
+            depth -= 1
+        yield event, value
+
+def unpack(entity_type_id, blob):
+    """An array.array of the elements in a packed BLOB_VALUE."""
+    values = array(TYPECODES[entity_type_id])
+    values.frombytes(blob)
+    if BIG_ENDIAN:
+        values.byteswap()
+    return values
+
+def to_numpy(entity_type_id, blob):
+    """A read-only NumPy array over a packed BLOB_VALUE or store view, without copying."""
+    if numpy is None:
+        raise ImportError("NumPy is required for to_numpy(); use unpack() for an array.array")
+    return numpy.frombuffer(blob, dtype=DTYPES[entity_type_id])
+
+def view_array(entity_type_id, length, view):
+    """The elements in a memoryview of a store payload, without copying where possible."""
+    if BIG_ENDIAN:
+        return unpack(entity_type_id, bytes(view))
+    return view.cast(TYPECODES[entity_type_id])
+
+def _load(entity_type_id, length, blob, offset, store, as_numpy):
+    if blob is None:
+        if store is None:
+            raise ValueError("Array is in the sidecar file; pass its ArrayStore")
+        view = store.view(offset, length * DTYPE_SIZES[entity_type_id])
+        return to_numpy(entity_type_id, view) if as_numpy else view_array(entity_type_id, length, view)
+    return to_numpy(entity_type_id, blob) if as_numpy else unpack(entity_type_id, blob)
+
+def read_array(connection, entity_id, as_numpy=False, store=None):
+    """Read the packed array stored as entity_id.
+
+    Arrays kept in BLOB_VALUE come back as an array.array; arrays in an
+    arraystore.ArrayStore sidecar as a memoryview over its map.  With
+    as_numpy=True either is a NumPy array viewing the stored bytes.
+    """
+    row = connection.execute(
+        "SELECT TYPE_ID, INTEGER_VALUE, BLOB_VALUE, NUMERIC_VALUE FROM Entity WHERE ID = ?", (entity_id,)
+    ).fetchone()
+    if row is None or row[0] not in ARRAY_TYPE_NAMES:
+        raise ValueError(f"Entity {entity_id} is not a packed array")
+    return _load(*row, store, as_numpy)
+
+def iter_arrays(connection, entity_type_ids=tuple(ARRAY_TYPE_NAMES), as_numpy=False, store=None):
+    """Yield (entity ID, elements) for every packed array, in sidecar file order."""
+    placeholders = ", ".join("?" * len(entity_type_ids))
+    cursor = connection.execute(
+        "SELECT ID, TYPE_ID, INTEGER_VALUE, BLOB_VALUE, NUMERIC_VALUE FROM Entity "
+        f"WHERE TYPE_ID IN ({placeholders}) ORDER BY NUMERIC_VALUE, ID",
+        tuple(entity_type_ids)
+    )
+    for entity_id, *row in cursor:
+        yield entity_id, _load(*row, store, as_numpy)
@@ -0,0 +1,63 @@
+"""ArrayStore payloads round-trip through the map, and through the Entity rows that point at them."""
+import pytest
+
+import ingest
+from arraystore import PAGE_SIZE, ArrayStore, sidecar_path
+from packedarray import PackedArray, read_array
+
+def test_sidecar_path():
+    assert sidecar_path("data/EntityRelationship.sqlite3") == "data/EntityRelationship.arrays"
+
+def test_payloads_start_on_page_boundaries(tmp_path):
+    path = tmp_path / "a.arrays"
+    with ArrayStore(path, "w") as store:
+        payloads = [b"x" * 10, b"y" * (PAGE_SIZE + 1), b"z"]
+        offsets = [store.append(payload) for payload in payloads]
+        assert offsets == [0, PAGE_SIZE, 3 * PAGE_SIZE]
+        for offset, payload in zip(offsets, payloads):
+            assert store.view(offset, len(payload)) == payload
+
+def test_view_remaps_after_growth(tmp_path):
+    with ArrayStore(tmp_path / "a.arrays", "w") as store:
+        first = store.view(store.append(b"first"), 5)
+        offset = store.append(b"second")
+        assert store.view(offset, 6) == b"second"
+        # The old map stays alive as long as a view of it does
+        assert first == b"first"
+
+def test_modes(tmp_path):
+    path = tmp_path / "a.arrays"
+    with ArrayStore(path, "w") as store:
+        store.append(b"one")
+    with ArrayStore(path, "a") as store:
+        offset = store.append(b"two")
+        assert offset == PAGE_SIZE
+    with ArrayStore(path, "r") as store:
+        assert store.view(0, 3) == b"one"
+        assert store.view(offset, 3) == b"two"
+    with ArrayStore(path, "w") as store:
+        assert store.size == 0
+        with pytest.raises(ValueError):
+            store.view(0, 1)
+
+@pytest.mark.parametrize("value_column", [False, True])
+def test_entities_point_into_the_store(tmp_path, value_column):
+    db_path = str(tmp_path / "EntityRelationship.sqlite3")
+    connection = ingest.create_database(db_path, value_column=value_column)
+    small, large = [1, 2], [float(i) for i in range(100)]
+    with ArrayStore(sidecar_path(db_path), "w", min_bytes=64) as store:
+        manager = ingest.EntityManager(connection, pack_min_length=2, array_store=store)
+        small_id = manager.get_or_create_entity(PackedArray.pack(small))
+        large_id = manager.get_or_create_entity(PackedArray.pack(large))
+        manager.flush()
+    (blob, offset), = connection.execute("SELECT BLOB_VALUE, NUMERIC_VALUE FROM Entity WHERE ID = ?", (large_id,))
+    assert (blob, offset) == (None, 0)
+
+    with ArrayStore(sidecar_path(db_path)) as store:
+        assert list(read_array(connection, small_id, store=store)) == small
+        assert list(read_array(connection, large_id, store=store)) == large
+        # Without the store only the arrays in BLOB_VALUE can be read
+        assert list(read_array(connection, small_id)) == small
+        with pytest.raises(ValueError):
+            read_array(connection, large_id)
+    connection.close()
@@ -0,0 +1,141 @@
+"""connect.py's Objects rows and FileMetadata facets for X3D JSON files."""
+import sys
+import json
+import sqlite3
+
+import pytest
+
+import connect
+
+TEXT, INTEGER, BOOLEAN, REAL, RELATED = (connect.COLUMN_NUMBERS[column] for column in
+                                         ("TEXT_VALUE", "INTEGER_VALUE", "BOOLEAN_VALUE", "REAL_VALUE", "RELATED_ID"))
+
+DOCUMENT = {"X3D": {
+    "head": {"meta": [{"@name": "title", "@content": "Box"}, {"@name": "version", "@content": " 1.10 "}]},
+    "Scene": {"-children": [
+        {"MetadataSet": {"@name": "set", "-value": [{"MetadataInteger": {"@name": "count", "@value": [1, 2]}}]}},
+        {"Shape": {"Appearance": {"Material": {"@diffuseColor": [0.5, 0.25, 1]}},
+                   "Coordinate": {"@point": [{"MetadataString": {"@name": "hidden", "@value": "x"}}]}}},
+        {"MetadataBoolean": {"@name": "flag", "@value": True}},
+        {"MetadataString": {"@name": "tags", "-value": ["a", "b"]}},
+        {"MetadataDouble": {"@name": "weight", "@value": 2.5}},
+    ]},
+}}
+
+@pytest.fixture
+def x3d_file(tmp_path):
+    path = tmp_path / "box.x3d.json"
+    path.write_text(json.dumps(DOCUMENT))
+    return str(path)
+
+@pytest.mark.parametrize("quick_check", [False, True])
+def test_extract_file(x3d_file, quick_check):
+    file_path, id_count, rows, facets, found = connect.extract_file(
+        x3d_file, frozenset(connect.DEFAULT_SKIP_FIELDS), quick_check)
+    assert (file_path, id_count) == (x3d_file, 24)
+    # IDs in depth-first order; the Metadata node under @point is never reached
+    assert rows == [
+        (0, "filename", TEXT, x3d_file),
+        (0, "meta", RELATED, 1), (1, "name", TEXT, "title"), (1, "content", TEXT, "Box"),
+        (0, "meta", RELATED, 2), (2, "name", TEXT, "version"), (2, "content", TEXT, " 1.10 "),
+        (11, "name", TEXT, "set"), (11, "metadataset", RELATED, 12),
+        (14, "name", TEXT, "count"), (14, "array", RELATED, 15), (15, 0, INTEGER, 1), (15, 1, INTEGER, 2),
+        (17, "diffuseColor", RELATED, 18),
+        (18, "red", INTEGER, 0.5), (18, "green", INTEGER, 0.25), (18, "blue", INTEGER, 1),
+        (11, "name", TEXT, "flag"), (11, "flag", BOOLEAN, "true"),
+        (11, "name", TEXT, "tags"), (11, "array", RELATED, 22), (22, 0, TEXT, "a"), (22, 1, TEXT, "b"),
+        (11, "name", TEXT, "weight"), (11, "weight", REAL, 2.5),
+    ]
+    assert facets == [("title", "Box", None), ("version", " 1.10 ", 1.1), ("count", "1", 1), ("count", "2", 2),
+                      ("flag", "true", None), ("tags", "a", None), ("tags", "b", None), ("weight", "2.5", 2.5)]
+    assert found == {"MetadataSet": 1, "MetadataInteger": 1, "Material": 1, "MetadataBoolean": 1,
+                     "MetadataString": 1, "MetadataDouble": 1}
+
+def test_skip_fields(x3d_file):
+    skipped = connect.extract_file(x3d_file, frozenset(connect.DEFAULT_SKIP_FIELDS))
+    walked = connect.extract_file(x3d_file, frozenset())
+    assert walked[4]["MetadataString"] == skipped[4]["MetadataString"] + 1
+    assert [row for row in walked[2] if row[1] == "hidden"] == [(20, "hidden", TEXT, "x")]
+    # Only the skipped node's own keys took IDs; everything before it is numbered alike
+    assert walked[1] == skipped[1] + 1
+    assert walked[2][:16] == skipped[2][:16]
+
+def test_quick_check_skips_files_without_nodes(tmp_path, monkeypatch):
+    path = tmp_path / "plain.json"
+    path.write_text('{"X3D": {"Scene": {"Shape": {}}}}')
+
+    def loads(text):
+        raise AssertionError("parsed")
+    monkeypatch.setattr(connect.json, "loads", loads)
+    assert connect.extract_file(str(path), frozenset(), quick_check=True)[1:] == (
+        1, [(0, "filename", TEXT, str(path))], [], {})
+
+@pytest.mark.parametrize("value, number", [(3, 3), (2.5, 2.5), (True, None), ("1.10", 1.1), (" 007 ", 7), ("-.5", -0.5),
+                                           ("1e3", 1000.0), ("2.", 2.0), ("1.2.3", None), ("0x10", None),
+                                           ("", None), ("v2", None)])
+def test_facet_number(value, number):
+    assert connect.facet_number(value) == number
+    assert type(connect.facet_number(value)) is type(number)
+
+def run(monkeypatch, db_dir, corpus, *flags):
+    monkeypatch.chdir(db_dir)
+    monkeypatch.setattr(sys, "argv", ["connect.py", str(corpus), *flags])
+    connect.main()
+    return sqlite3.connect(db_dir / "ThreeDimAssets.sqlite3")
+
+def facets(connection):
+    """FileMetadata rows as (file name, property name, VALUE and its type, NUMBER)."""
+    return sorted(connection.execute('''
+        SELECT s.SOURCE_FILE, p.NAME, f.VALUE, typeof(f.VALUE), f.NUMBER
+        FROM FileMetadata f JOIN SourceManifest s ON s.ROOT_ID = f.FILE_ID
+             JOIN PropertyName p ON p.ID = f.PROPERTY_NAME_ID
+    '''))
+
+def document(version, author="X"):
+    return {"X3D": {"head": {"meta": [{"@name": "author", "@content": author},
+                                      {"@name": "version", "@content": version}]},
+                    "Scene": {"-children": [{"MetadataInteger": {"@name": "count", "@value": [1, 2]}}]}}}
+
+def test_file_metadata(tmp_path, monkeypatch):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    a, b = str(corpus / "a.json"), str(corpus / "b.json")
+    (corpus / "a.json").write_text(json.dumps(document("1.10")))
+    (corpus / "b.json").write_text(json.dumps(document("007", author="Y")))
+    connection = run(monkeypatch, tmp_path, corpus)
+
+    # Text as written, so "1.10" and "007" match exactly, with the number beside it
+    assert facets(connection) == [
+        (a, "author", "X", "text", None), (a, "count", "1", "text", 1), (a, "count", "2", "text", 2),
+        (a, "version", "1.10", "text", 1.1),
+        (b, "author", "Y", "text", None), (b, "count", "1", "text", 1), (b, "count", "2", "text", 2),
+        (b, "version", "007", "text", 7),
+    ]
+    # The query the FileMetadata comment gives, by value and by number range
+    query = '''
+        SELECT s.SOURCE_FILE
+        FROM FileMetadata a JOIN SourceManifest s ON s.ROOT_ID = a.FILE_ID
+        WHERE a.PROPERTY_NAME_ID = (SELECT ID FROM PropertyName WHERE NAME = 'author') AND a.VALUE = ?
+          AND EXISTS (SELECT 1 FROM FileMetadata v
+                      WHERE v.FILE_ID = a.FILE_ID AND v.NUMBER >= ?
+                        AND v.PROPERTY_NAME_ID = (SELECT ID FROM PropertyName WHERE NAME = 'version'))
+    '''
+    assert connection.execute(query, ("X", 1)).fetchall() == [(a,)]
+    assert connection.execute(query, ("Y", 3)).fetchall() == [(b,)]
+    assert connection.execute(query, ("X", 3)).fetchall() == []
+    connection.close()
+
+def test_file_metadata_incremental(tmp_path, monkeypatch):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "a.json").write_text(json.dumps(document("1")))
+    (corpus / "b.json").write_text(json.dumps(document("2")))
+    run(monkeypatch, tmp_path, corpus).close()
+
+    (corpus / "a.json").write_text(json.dumps(document("3", author="Z")))
+    (corpus / "b.json").unlink()
+    connection = run(monkeypatch, tmp_path, corpus, "--incremental")
+    a = str(corpus / "a.json")
+    assert facets(connection) == [(a, "author", "Z", "text", None), (a, "count", "1", "text", 1),
+                                  (a, "count", "2", "text", 2), (a, "version", "3", "text", 3)]
+    connection.close()
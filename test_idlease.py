@@ -0,0 +1,73 @@
+"""IdAllocator leases disjoint blocks of IDs, with and without RETURNING."""
+import sqlite3
+
+import pytest
+
+import idlease
+from idlease import MAX_BLOCK_GROWTH, IdAllocator
+
+@pytest.fixture(params=[True, False], ids=["returning", "no-returning"])
+def db_path(request, tmp_path, monkeypatch):
+    """A database with a table Rows holding IDs 1 to 5, leased from with and without RETURNING."""
+    if not request.param:
+        monkeypatch.setattr(idlease, "SQLITE_HAS_RETURNING", False)
+    elif not idlease.SQLITE_HAS_RETURNING:
+        pytest.skip("SQLite before 3.35 has no RETURNING")
+    path = tmp_path / "ids.sqlite3"
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE Rows (ID INTEGER PRIMARY KEY)")
+    connection.executemany("INSERT INTO Rows (ID) VALUES (?)", [(i,) for i in range(1, 6)])
+    connection.commit()
+    connection.close()
+    return path
+
+def next_id(db_path):
+    connection = sqlite3.connect(db_path)
+    (row_id,), = connection.execute("SELECT NEXT_ID FROM IdAllocator WHERE NAME = 'Rows'")
+    connection.close()
+    return row_id
+
+def test_first_lease_follows_existing_rows(db_path):
+    ids = IdAllocator(sqlite3.connect(db_path), "Rows", block_size=10)
+    assert [ids.next() for _ in range(3)] == [6, 7, 8]
+    assert ids.issued == 3
+    assert next_id(db_path) == 16
+
+def test_blocks_double_up_to_the_limit(db_path):
+    ids = IdAllocator(sqlite3.connect(db_path), "Rows", block_size=2)
+    sizes = []
+    for _ in range(MAX_BLOCK_GROWTH * 2 * 3):
+        before = ids.limit
+        ids.next()
+        if ids.limit != before:
+            sizes.append(ids.limit - ids.next_id + 1)
+    assert sizes[:6] == [2, 4, 8, 16, 32, 32]
+    assert set(sizes[5:]) == {2 * MAX_BLOCK_GROWTH}
+    assert next_id(db_path) == ids.limit
+
+def test_writers_never_share_an_id(db_path):
+    writers = [IdAllocator(sqlite3.connect(db_path), "Rows", block_size=3) for _ in range(3)]
+    handed_out = [writer.next() for _ in range(50) for writer in writers]
+    handed_out += [writers[1].take(7), writers[2].take(40)]
+    assert len(set(handed_out)) == len(handed_out)
+    assert min(handed_out) == 6
+
+def test_take(db_path):
+    ids = IdAllocator(sqlite3.connect(db_path), "Rows", block_size=10)
+    assert ids.take(4) == 6
+    assert ids.take(3) == 10
+    # No room left for 5, but the new block follows on: the run spans both
+    assert ids.take(5) == 13
+    other = IdAllocator(sqlite3.connect(db_path), "Rows", block_size=10)
+    assert other.next() == 26
+    # Another writer leased in between, so the rest of the block is skipped
+    assert ids.take(25) == 36
+    assert ids.issued == 37
+
+def test_lease_commits_the_callers_transaction(db_path):
+    connection = sqlite3.connect(db_path)
+    connection.execute("INSERT INTO Rows (ID) VALUES (100)")
+    IdAllocator(connection, "Rows").next()
+    reader = sqlite3.connect(db_path)
+    assert reader.execute("SELECT 1 FROM Rows WHERE ID = 100").fetchone() == (1,)
+    reader.close()
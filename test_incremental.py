@@ -0,0 +1,110 @@
+"""An --incremental run after files change or go away leaves what a full rebuild would."""
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+
+import pytest
+
+import ingest
+from arraystore import ArrayStore, sidecar_path
+from packedarray import ARRAY_TYPE_NAMES, read_array
+
+# The "points" arrays are long enough for the sidecar in the --array-store cases
+OLD_FILES = {
+    "a.json": {"name": "a", "shared": {"x": [1, 2]}, "list": [1, 2.5, "both"], "points": [0.5, 1.5] * 4},
+    "b.json": {"name": "b-before", "list": [1, "both", "b-before", 7.5, None, True],
+               "shared": {"x": [1, 2]}, "nested": {"deep": {"k": "gone"}}, "points": list(range(16))},
+    "c.json": {"c": ["c-only", {"k": "v"}, None], "points": [2.5] * 8},
+}
+
+NEW_B = {"name": "b-after", "list": [1, "b-after"], "shared": {"x": [1, 2]}, "extra": [{"k": "v"}, False],
+         "points": [3.5, 4.5] * 4}
+
+def write_files(directory, files):
+    for name, document in files.items():
+        (directory / name).write_text(json.dumps(document))
+
+def run(monkeypatch, run_dir, corpus, visitor_class, *flags):
+    """Ingest corpus into run_dir as insert*.py would and return the database path."""
+    run_dir.mkdir(exist_ok=True)
+    monkeypatch.chdir(run_dir)
+    monkeypatch.setattr(sys, "argv", ["ingest.py", *flags])
+    ingest.main(visitor_class, file_patterns=(".json",), search_dir=str(corpus))
+    return run_dir / "EntityRelationship.sqlite3"
+
+def digest(item):
+    return hashlib.sha1(repr(item).encode()).hexdigest()
+
+def canonical(db_path):
+    """The database's rows with IDs replaced by what they identify.
+
+    An object or array is labelled by a hash of its type, file and edges,
+    an interned value by a hash of the value, and a packed array by its
+    elements rather than where they are stored: the sidecar only grows,
+    so offsets differ between an incremental run and a rebuild.  Which
+    file an interned value is credited to depends on ingest order, so it
+    is left out.
+    """
+    connection = sqlite3.connect(db_path)
+    store = ArrayStore(sidecar_path(str(db_path))) if os.path.exists(sidecar_path(str(db_path))) else None
+    entities = {}
+    for entity_id, entity_type_id, *values, source_file in connection.execute(
+        "SELECT ID, TYPE_ID, INTEGER_VALUE, TEXT_VALUE, BOOLEAN_VALUE, REAL_VALUE, SOURCE_FILE FROM Entity"
+    ):
+        if entity_type_id in ARRAY_TYPE_NAMES:
+            values = read_array(connection, entity_id, store=store).tobytes()
+        entities[entity_id] = entity_type_id, values, source_file
+    edges = {}
+    for source_id, property_id, target_id, *rest, target_value in connection.execute(
+        "SELECT SOURCE_ID, PROPERTY_ID, TARGET_ID, RELATIONSHIP_TYPE, ORDINAL, TARGET_VALUE FROM Relationship"
+    ):
+        # An interned target's value is in its label; a packed one's TARGET_VALUE is a payload or offset
+        if target_id is not None:
+            target_value = None
+        edges.setdefault(source_id, []).append((property_id, target_id, *rest, target_value))
+    labels = {None: None}
+
+    def label(entity_id):
+        if entity_id not in labels:
+            entity_type_id, values, source_file = entities[entity_id]
+            if entity_type_id <= 6:
+                labels[entity_id] = digest((entity_type_id, values))
+            else:
+                members = sorted(digest((label(property_id), label(target_id), *rest))
+                                 for property_id, target_id, *rest in edges.get(entity_id, ()))
+                labels[entity_id] = digest((entity_type_id, source_file, values, members))
+        return labels[entity_id]
+
+    containers = sorted(label(entity_id) for entity_id, row in entities.items() if row[0] > 6)
+    values = sorted(label(entity_id) for entity_id, row in entities.items() if row[0] <= 6)
+    value_edges = sorted(digest((label(source_id), label(property_id), label(target_id), *rest))
+                         for source_id, source_edges in edges.items() if entities[source_id][0] <= 6
+                         for property_id, target_id, *rest in source_edges)
+    shared = sorted((label(entity_id), refcount)
+                    for entity_id, refcount in connection.execute("SELECT ENTITY_ID, REFCOUNT FROM SubtreeHash"))
+    files = sorted(row[0] for row in connection.execute("SELECT SOURCE_FILE FROM SourceManifest"))
+    connection.close()
+    if store is not None:
+        store.close()
+    return containers, values, value_edges, shared, files
+
+@pytest.mark.parametrize("flags", [(), ("--dedup",), ("--clustered",), ("--value-column",),
+                                   ("--inline-scalars", "TEXT,REAL"), ("--dedup", "--clustered"),
+                                   ("--pack-arrays", "2"), ("--pack-arrays", "2", "--array-store", "32"),
+                                   ("--value-column", "--pack-arrays", "2", "--array-store", "32")])
+@pytest.mark.parametrize("visitor_class", [ingest.PropertyVisitor, ingest.ScalarRelationshipVisitor,
+                                           ingest.ValueVisitor, ingest.NullValueVisitor])
+def test_incremental_matches_full_rebuild(tmp_path, monkeypatch, visitor_class, flags):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    write_files(corpus, OLD_FILES)
+    run(monkeypatch, tmp_path / "incremental", corpus, visitor_class, *flags)
+
+    write_files(corpus, {"b.json": NEW_B})
+    (corpus / "c.json").unlink()
+    incremental = run(monkeypatch, tmp_path / "incremental", corpus, visitor_class, "--incremental", *flags)
+    full = run(monkeypatch, tmp_path / "full", corpus, visitor_class, *flags)
+
+    assert canonical(incremental) == canonical(full)
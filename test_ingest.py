@@ -0,0 +1,106 @@
+"""EntityManager's write-behind buffer and the Bloom filter in front of interning."""
+import sqlite3
+
+import pytest
+
+import ingest
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "EntityRelationship.sqlite3"
+
+@pytest.fixture
+def connection(db_path):
+    """A new database's connection, with foreign keys on as ingest.main() has it."""
+    connection = ingest.create_database(str(db_path))
+    yield connection
+    connection.close()
+
+def count(db_path, table):
+    connection = sqlite3.connect(db_path)
+    (rows,), = connection.execute(f"SELECT COUNT(*) FROM {table}")
+    connection.close()
+    return rows
+
+def test_rows_are_written_on_flush(db_path, connection):
+    manager = ingest.EntityManager(connection)
+    parent_id = manager.create_entity(7, source_file="a.json")
+    manager.create_value_relationship(parent_id, manager.get_or_create_entity("name"), "a", "a.json")
+    assert (count(db_path, "Entity"), count(db_path, "Relationship")) == (0, 0)
+
+    manager.flush()
+    assert (count(db_path, "Entity"), count(db_path, "Relationship")) == (3, 1)
+
+def test_full_batch_flushes(db_path, connection):
+    manager = ingest.EntityManager(connection, batch_size=3)
+    manager.create_entity(7)
+    manager.create_entity(8)
+    assert count(db_path, "Entity") == 0
+    manager.create_entity(9)
+    assert count(db_path, "Entity") == 3
+    assert manager.pending_count == 0
+
+def test_queued_value_is_reused_before_flush(db_path, connection):
+    # A cache too small to hold anything leaves queued_values to find it
+    manager = ingest.EntityManager(connection, cache_bytes=0)
+    first = manager.get_or_create_entity("twice")
+    assert manager.get_or_create_entity("twice") == first
+    manager.flush()
+    assert manager.get_or_create_entity("twice") == first
+    assert count(db_path, "Entity") == 1
+
+def test_entities_are_written_before_relationships(db_path, connection):
+    # Queued the other way round; foreign keys are on, so the order of the writes matters
+    manager = ingest.EntityManager(connection)
+    source_id, target_id = manager.generate_id(), manager.generate_id()
+    manager.create_relationship(source_id, None, target_id, "ARRAY_ELEMENT", ordinal=0)
+    for entity_id, entity_type_id in ((source_id, 8), (target_id, 7)):
+        manager._queue("INSERT INTO EntityData (ID, TYPE_ID, SOURCE_FILE_ID) VALUES (?, ?, ?)",
+                       (entity_id, entity_type_id, None))
+    manager.flush()
+    assert count(db_path, "Relationship") == 1
+
+def test_bad_relationship_does_not_drop_its_batch(db_path, connection):
+    manager = ingest.EntityManager(connection)
+    parent_id = manager.create_entity(7)
+    manager.create_relationship(parent_id, None, parent_id + 1000, "ARRAY_ELEMENT", ordinal=0)  # no such entity
+    manager.create_relationship(parent_id, None, manager.create_entity(7), "ARRAY_ELEMENT", ordinal=1)
+    manager.flush()
+    assert count(db_path, "Relationship") == 1
+
+def test_bloom_filter_sizing():
+    bloom = ingest.BloomFilter(max_bytes=1001, error_rate=0.01)
+    assert (bloom.word_count, bloom.max_bytes, bloom.hash_count) == (125, 1000, 7)
+    # capacity is the most keys that keep the estimate within error_rate
+    assert bloom._error_rate(bloom.capacity) <= 0.01 < bloom._error_rate(bloom.capacity + 1)
+    assert ingest.BloomFilter(max_bytes=2000, error_rate=0.01).capacity > bloom.capacity
+    assert ingest.BloomFilter(max_bytes=1000, error_rate=0.001).capacity < bloom.capacity
+
+def test_bloom_filter_false_positives():
+    bloom = ingest.BloomFilter(max_bytes=64 * 1024, error_rate=0.01)
+    # Integers and the floats whose hashes are poorly spread, both deterministic across runs
+    keys = [(1, i) for i in range(0, 2 * bloom.capacity, 2)][:bloom.capacity // 2]
+    keys += [(5, i / 4) for i in range(bloom.capacity - len(keys))]
+    for key in keys:
+        bloom.add(key)
+    assert len(bloom) == bloom.capacity
+    # Never a false negative
+    assert not any(bloom.add_if_new(key) for key in keys)
+
+    probes = [(1, i) for i in range(1, 20001, 2)] + [(5, i + 0.125) for i in range(10000)]
+    false_positives = sum(not bloom.add_if_new(key) for key in probes)
+    assert false_positives / len(probes) < 2 * bloom.error_rate
+
+def test_bloom_filter_sees_values_already_interned(db_path, connection):
+    manager = ingest.EntityManager(connection)
+    existing = [(value, manager.get_or_create_entity(value)) for value in ("a", 1, 2.5, True)]
+    manager.flush()
+
+    manager = ingest.EntityManager(connection, bloom_bytes=1024)
+    assert len(manager.bloom_filter) == len(existing)
+    for value, entity_id in existing:
+        assert manager.get_or_create_entity(value) == entity_id
+    new_id = manager.get_or_create_entity("b")
+    assert manager.get_or_create_entity("b") == new_id
+    manager.flush()
+    assert count(db_path, "Entity") == len(existing) + 1
@@ -0,0 +1,56 @@
+"""IngestStats charges time to one phase at a time and counts what an ingest run wrote."""
+import sys
+import json
+import time
+import sqlite3
+
+import ingest
+from instrument import IngestStats
+
+def test_nested_phases_add_up(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(time, "perf_counter", lambda: clock[0])
+    monkeypatch.setattr(time, "process_time", lambda: clock[0] / 2)
+
+    def spend(seconds):
+        clock[0] += seconds
+
+    stats = IngestStats()
+    spend(1)
+    with stats.phase("insert"):
+        spend(2)
+        stats.timed("lookup", spend)(4)
+        spend(8)
+    for _ in stats.timed_iter("parse", [16, 32]):
+        spend(64)
+
+    summary = stats.summary()
+    phases = {name: (phase["wall_seconds"], phase["cpu_seconds"], phase["calls"])
+              for name, phase in summary["phases"].items()}
+    # The loop body runs outside timed_iter's next(), so it is walk time
+    assert phases == {"walk": (129, 64.5, 0), "insert": (10, 5, 1), "lookup": (4, 2, 1), "parse": (0, 0, 0)}
+    assert summary["wall_seconds"] == sum(wall for wall, cpu, calls in phases.values())
+
+def test_summary_counts_rows(tmp_path, monkeypatch):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "a.json").write_text(json.dumps({"k": ["v", "v", 1], "o": {"k": None}}))
+    (corpus / "b.json").write_text(json.dumps({"k": "v"}))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["insert.py", "--stats", "stats.json"])
+    ingest.main(ingest.PropertyVisitor, file_patterns=(".json",), search_dir=str(corpus))
+
+    summary = json.loads((tmp_path / "stats.json").read_text())
+    connection = sqlite3.connect(tmp_path / "EntityRelationship.sqlite3")
+    (entities, values), = connection.execute("SELECT COUNT(*), COUNT(*) FILTER (WHERE TYPE_ID <= 6) FROM Entity")
+    (relationships,), = connection.execute("SELECT COUNT(*) FROM Relationship")
+    connection.close()
+
+    assert summary["rows"] == {"Entity": entities, "Relationship": relationships}
+    assert sorted(record["path"] for record in summary["files"]) == [str(corpus / "a.json"), str(corpus / "b.json")]
+    assert sum(record["rows"]["Entity"] for record in summary["files"]) == entities
+    assert sum(record["rows"]["Relationship"] for record in summary["files"]) == relationships
+    # Every value was new, and each was looked up once before the cache had it
+    assert summary["interning"]["intern_inserted"] == values
+    assert summary["interning"].get("intern_found", 0) == 0
+    assert summary["interning"]["cache_misses"] == values
@@ -0,0 +1,48 @@
+"""iter_events yields what json.loads decodes, however the input is split into chunks."""
+import io
+import json
+import math
+import codecs
+
+import pytest
+
+from ingest import iter_tree_events
+from jsonstream import iter_events
+
+DOCUMENT = '''{"name": "café \\u00e9\\n\\"q\\" \U0001f600", "empty": {}, "none": [],
+ "numbers": [0, -12, 3.25, -0.5, 1e3, 2.5E-2, 12345678901234567890, -Infinity, Infinity],
+ "literals": [true, false, null],
+ "nested": [[{"k": [[], {}]}], {"a": {"b": {"c": "deep"}}}],
+ "long": "%s"}
+''' % ("x" * 100)
+
+def events(text, chunk_size, binary):
+    """Tokenize text from a str, or from its UTF-8 bytes after a byte order mark."""
+    f = io.BytesIO(codecs.BOM_UTF8 + text.encode()) if binary else io.StringIO(text)
+    return list(iter_events(f, chunk_size))
+
+@pytest.mark.parametrize("binary", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64, 1 << 16])
+def test_events_match_json_loads(chunk_size, binary):
+    # Every small chunk size puts a boundary inside each string, number, literal and escape
+    # somewhere, and in the binary case inside the BOM and the multi-byte characters
+    expected = list(iter_tree_events(json.loads(DOCUMENT)))
+    assert events(DOCUMENT, chunk_size, binary) == expected
+
+@pytest.mark.parametrize("text, value", [("1e5", 1e5), ("-0", 0), ("NaN", None), ("-Infinity", -math.inf),
+                                         ('"a\\u0041"', "aA"), ("null", None), ("  7  ", 7)])
+@pytest.mark.parametrize("chunk_size", [1, 2, 1 << 16])
+def test_top_level_scalar(text, value, chunk_size):
+    (event, decoded), = events(text, chunk_size, binary=True)
+    assert event == "scalar"
+    if text == "NaN":
+        assert math.isnan(decoded)
+    else:
+        assert decoded == value and type(decoded) is type(json.loads(text))
+
+@pytest.mark.parametrize("text", ['{"a" 1}', '{"a": 1,}', '[1 2]', '[1, 2', '{"a": 1} x', '{1: 2}', '[tru]',
+                                  '"open', '[-]', ''])
+@pytest.mark.parametrize("chunk_size", [1, 1 << 16])
+def test_malformed(text, chunk_size):
+    with pytest.raises(json.JSONDecodeError):
+        events(text, chunk_size, binary=False)
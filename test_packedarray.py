@@ -0,0 +1,76 @@
+"""Packing numeric arrays, in pack_arrays() streams and through a database."""
+import struct
+
+import pytest
+
+import ingest
+from packedarray import (FLOAT64_ARRAY, INT32_ARRAY, INT64_ARRAY, MAX_EXACT_FLOAT_INT, PackedArray, iter_arrays,
+                         pack_arrays, read_array, unpack)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+@pytest.mark.parametrize("values, entity_type_id, fmt", [
+    ([1, -2, 2 ** 31 - 1, -2 ** 31], INT32_ARRAY, "<4i"),
+    ([1, 2 ** 31], INT64_ARRAY, "<2q"),
+    ([-2 ** 63, 2 ** 63 - 1], INT64_ARRAY, "<2q"),
+    ([0.5, -1e300], FLOAT64_ARRAY, "<2d"),
+    ([1, 2.5, MAX_EXACT_FLOAT_INT], FLOAT64_ARRAY, "<3d"),
+])
+def test_pack_round_trip(values, entity_type_id, fmt):
+    packed = PackedArray.pack(values)
+    assert (packed.entity_type_id, packed.length) == (entity_type_id, len(values))
+    # Little-endian whatever the platform
+    assert packed.data == struct.pack(fmt, *values)
+    assert list(unpack(entity_type_id, packed.data)) == values
+    assert list(packed.to_array()) == values
+
+@pytest.mark.parametrize("values", [
+    [2 ** 63],                           # too big for INT64_ARRAY
+    [1.5, MAX_EXACT_FLOAT_INT + 1],      # the int would not survive as a float
+    [1, "2"], [True, False], [1, None],  # not all numbers
+])
+def test_pack_refuses(values):
+    assert PackedArray.pack(values) is None
+
+def test_equal_arrays_hash_alike():
+    assert PackedArray.pack([1, 2]) == PackedArray.pack([1, 2]) != PackedArray.pack([1.0, 2.0])
+    assert hash(PackedArray.pack([1, 2])) == hash(PackedArray.pack([1, 2]))
+
+def events(document, min_length=2):
+    return list(pack_arrays(ingest.iter_tree_events(document), min_length))
+
+def test_pack_arrays_packs_numeric_arrays_only():
+    document = {"point": [1, 2, 3], "short": [4], "mixed": [1, "a", 2], "nested": [[0.5, 1], [{"k": 1}, 2]]}
+    packed = ingest.iter_tree_events({
+        "point": PackedArray.pack([1, 2, 3]),
+        "short": [4],
+        "mixed": [1, "a", 2],
+        "nested": [PackedArray.pack([0.5, 1]), [{"k": 1}, 2]],
+    })
+    assert events(document) == list(packed)
+
+def test_pack_arrays_leaves_the_document_and_empty_arrays():
+    assert events([1, 2, 3]) == list(ingest.iter_tree_events([1, 2, 3]))
+    assert events({"e": []}, min_length=0) == list(ingest.iter_tree_events({"e": []}))
+
+@pytest.mark.parametrize("value_column", [False, True])
+def test_read_array(tmp_path, value_column):
+    connection = ingest.create_database(str(tmp_path / "EntityRelationship.sqlite3"), value_column=value_column)
+    manager = ingest.EntityManager(connection, pack_min_length=2)
+    arrays = {manager.get_or_create_entity(PackedArray.pack(values)): values
+              for values in ([1, 2, 3], [2 ** 40, -1], [0.25, 4.0])}
+    manager.flush()
+
+    for entity_id, values in arrays.items():
+        assert list(read_array(connection, entity_id)) == values
+    assert {entity_id: list(elements) for entity_id, elements in iter_arrays(connection)} == arrays
+    assert [arrays[entity_id] for entity_id, elements in iter_arrays(connection, [INT64_ARRAY])] == [[2 ** 40, -1]]
+    if numpy is not None:
+        for entity_id, values in arrays.items():
+            assert read_array(connection, entity_id, as_numpy=True).tolist() == values
+    with pytest.raises(ValueError):
+        read_array(connection, max(arrays) + 1)
+    connection.close()